@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Pruebas de rendimiento contra replay_server (sin red)
+Mide formularios/s, bytes/s y latencia p50/p99 de QuickDownloader.run
+(en frío y con GET condicional), USCISFormsScraper.run y del análisis del
+HTML de formularios. --baseline compara con un resultado anterior (--json) y
+termina con código 1 si el rendimiento baja más de --tolerance.
+"""
+
+import contextlib
+import io
+import json
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import form_discovery
+from download_metrics import percentile
+from quick_download import QuickDownloader
+from replay_server import SNAPSHOT_PATH, ReplayServer, replay_session
+from uscis_scraper import USCISFormsScraper
+
+BENCHMARKS = ('discovery', 'quick_cold', 'quick_warm', 'scraper')
+
+
+class LatencyRecorder:
+    """Hook de respuesta de requests: latencia de cada petición y PDF servidos"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = []
+        self.forms = 0
+
+    def __call__(self, response, *args, **kwargs):
+        with self.lock:
+            self.latencies.append(response.elapsed.total_seconds())
+            if response.url.lower().endswith('.pdf') and response.status_code in (200, 206, 304):
+                self.forms += 1
+        return response
+
+
+def measure(server, run):
+    """Ejecutar run(session) con una sesión nueva y devolver las métricas"""
+    recorder = LatencyRecorder()
+    session = replay_session(server.base_url)
+    session.hooks['response'].append(recorder)
+    server.stats.reset()
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        run(session)
+    elapsed = time.perf_counter() - start
+    session.close()
+
+    stats = server.stats.snapshot()
+    return {
+        'seconds': round(elapsed, 3),
+        'requests': stats['requests'],
+        'status': {str(k): v for k, v in sorted(stats['status'].items())},
+        'forms': recorder.forms,
+        'forms_per_s': round(recorder.forms / elapsed, 2),
+        'bytes_per_s': round(stats['bytes_sent'] / elapsed),
+        'p50_ms': round(percentile(recorder.latencies, 50) * 1000, 2),
+        'p99_ms': round(percentile(recorder.latencies, 99) * 1000, 2),
+    }
+
+
+def bench_discovery(snapshot=SNAPSHOT_PATH, repeat=20):
+    """Análisis con lxml de la copia guardada (sin red)"""
+    with open(snapshot, encoding='utf-8') as f:
+        html = f.read()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        forms = form_discovery.parse_forms_html(html)
+        timings.append(time.perf_counter() - start)
+    total = sum(timings)
+    return {
+        'seconds': round(total, 3),
+        'forms': len(forms),
+        'forms_per_s': round(len(forms) * repeat / total, 2),
+        'bytes_per_s': round(len(html.encode('utf-8')) * repeat / total),
+        'p50_ms': round(percentile(timings, 50) * 1000, 2),
+        'p99_ms': round(percentile(timings, 99) * 1000, 2),
+    }
+
+
+def bench_quick_download(server, output_dir, workers=8):
+    """QuickDownloader en frío y de nuevo sobre el mismo directorio (304)"""
+    def run(session):
+        QuickDownloader(workers=workers, max_per_second=0, session=session,
+                        output_dir=output_dir, extract=False).run()
+
+    return measure(server, run), measure(server, run)
+
+
+def bench_scraper(server, output_dir):
+    """USCISFormsScraper: API (404), HTML de la página y descarga secuencial"""
+    def run(session):
+        USCISFormsScraper(output_dir=output_dir, session=session, delay=0).run(browser='never', extract=False)
+
+    return measure(server, run)
+
+
+def run_benchmarks(server, only=BENCHMARKS, workers=8, repeat=20):
+    results = {}
+    if 'discovery' in only:
+        results['discovery'] = bench_discovery(repeat=repeat)
+
+    tmp = tempfile.mkdtemp(prefix='uscis_bench_')
+    try:
+        if 'quick_cold' in only or 'quick_warm' in only:
+            cold, warm = bench_quick_download(server, f'{tmp}/quick', workers)
+            if 'quick_cold' in only:
+                results['quick_cold'] = cold
+            if 'quick_warm' in only:
+                results['quick_warm'] = warm
+        if 'scraper' in only:
+            results['scraper'] = bench_scraper(server, f'{tmp}/scraper')
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Benchmarks cuyo rendimiento (formularios/s) cae más de tolerance respecto a baseline"""
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if not before or not before.get('forms_per_s'):
+            continue
+        ratio = result['forms_per_s'] / before['forms_per_s']
+        if ratio < 1 - tolerance:
+            regressions.append((name, before['forms_per_s'], result['forms_per_s'], ratio))
+    return regressions
+
+
+def print_results(results):
+    print(f"{'benchmark':<12} {'s':>8} {'forms':>6} {'forms/s':>9} {'MB/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for name, r in results.items():
+        print(f"{name:<12} {r['seconds']:>8.3f} {r['forms']:>6} {r['forms_per_s']:>9.1f} "
+              f"{r['bytes_per_s'] / 1e6:>8.1f} {r['p50_ms']:>8.2f} {r['p99_ms']:>8.2f}")
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmarks de descarga contra un servidor local')
+    parser.add_argument('--only', nargs='+', choices=BENCHMARKS, default=list(BENCHMARKS))
+    parser.add_argument('--workers', type=int, default=8, help='hilos de QuickDownloader')
+    parser.add_argument('--repeat', type=int, default=20, help='repeticiones del análisis del HTML')
+    parser.add_argument('--latency', type=float, default=0.0, help='ms por petición en el servidor')
+    parser.add_argument('--jitter', type=float, default=0.0, help='ms aleatorios adicionales (máximo)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fracción de respuestas 503')
+    parser.add_argument('--missing-rate', type=float, default=0.0, help='fracción de formularios con 404')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help='guardar los resultados en este archivo')
+    parser.add_argument('--baseline', help='resultados anteriores (--json) para comparar')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='caída de formularios/s permitida frente a --baseline (0.2 = 20%%)')
+    args = parser.parse_args()
+
+    server = ReplayServer(latency=args.latency / 1000, jitter=args.jitter / 1000, error_rate=args.error_rate,
+                          missing_rate=args.missing_rate, seed=args.seed)
+    server.start()
+    try:
+        results = run_benchmarks(server, args.only, args.workers, args.repeat)
+    finally:
+        server.stop()
+
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.tolerance)
+        for name, before, after, ratio in regressions:
+            print(f"✗ {name}: {before:.1f} -> {after:.1f} formularios/s ({(ratio - 1) * 100:+.0f}%)")
+        if regressions:
+            sys.exit(1)
+        print("✓ Sin regresiones frente a la línea base")
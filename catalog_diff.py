@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+"""
+Comparación del catálogo: lista oficial, formularios descubiertos, BD y PDF en disco
+Cada fuente se indexa por (número, suplemento), así "I-485 Supplement A" no
+se confunde con el I-485, y el resultado se cruza con operaciones de
+conjuntos. Sale como texto, JSON o CSV; los descargadores lo llaman al final
+de run() y guardan coverage.json.
+"""
+
+import csv
+import json
+import os
+
+import forms_db
+from consistency import scan_dir
+from form_discovery import form_name, split_form_name
+from pdf_store import PDFS_PATH
+
+REPORT_PATH = 'comparison_report.txt'
+
+# Lista oficial USCIS
+OFFICIAL_FORMS = [
+    "AR-11", "EOIR-29", "G-28", "G-28I", "G-325A", "G-325R", "G-639", "G-845",
+    "G-845 Supplement", "G-884", "G-1041", "G-1041A", "G-1055", "G-1145", "G-1256",
+    "G-1450", "G-1566", "G-1650", "G-1651", "I-9", "I-90", "I-102", "I-129",
+    "I-129CW", "I-129CWR", "I-129F", "I-129S", "I-130", "I-131", "I-131A", "I-134",
+    "I-140", "I-140G", "I-191", "I-192", "I-193", "I-212", "I-290B", "I-356",
+    "I-360", "I-361", "I-363", "I-407", "I-485", "I-485 Supplement A",
+    "I-485 Supplement J", "I-508", "I-526", "I-526E", "I-539", "I-566", "I-589",
+    "I-600", "I-600A", "I-601", "I-601A", "I-602", "I-612", "I-687", "I-690",
+    "I-693", "I-694", "I-698", "I-730", "I-751", "I-765", "I-765V", "I-800",
+    "I-800A", "I-817", "I-821", "I-821D", "I-824", "I-829", "I-854", "I-864",
+    "I-864A", "I-864EZ", "I-864P", "I-865", "I-881", "I-905", "I-907", "I-910",
+    "I-912", "I-914", "I-918", "I-929", "I-941", "I-945", "I-956", "I-956F",
+    "I-956G", "I-956H", "I-956K", "N-300", "N-336", "N-400", "N-426", "N-470",
+    "N-565", "N-600", "N-600K", "N-644", "N-648"
+]
+
+# Estado de cada formulario en el resultado, en orden de prioridad
+STATUSES = {
+    'no_file': 'descargado según la BD pero sin PDF',
+    'ok': 'de la lista oficial y descargado',
+    'extra': 'descargado pero no está en la lista oficial',
+    'missing': 'de la lista oficial y no descargado',
+    'untracked': 'PDF en disco sin registro descargado',
+    'new': 'descubierto pero no está en la lista oficial',
+    'not_found': 'intentado sin éxito (no está en la lista oficial)',
+}
+
+CSV_FIELDS = ['form', 'status', 'official', 'discovered', 'tried', 'downloaded', 'file']
+
+
+def form_key(name):
+    """('I-485', 'A') para 'I-485 Supplement A'; nombres no reconocidos se usan tal cual"""
+    return split_form_name(name) or (' '.join(name.split()).upper(), None)
+
+
+def index(names):
+    """{clave: nombre canónico} de una fuente"""
+    return {key: form_name(*key) for key in map(form_key, names)}
+
+
+def load_db(conn):
+    """(intentados, descargados): {clave: nombre} de la tabla forms"""
+    tried, downloaded = {}, {}
+    for number, status in conn.execute('SELECT form_number, status FROM forms'):
+        key = form_key(number)
+        tried[key] = number
+        if status == 'downloaded':
+            downloaded[key] = number
+    return tried, downloaded
+
+
+def diff(official, tried, downloaded, files, discovered=None):
+    """
+    Cruzar las fuentes (cada una un {clave: nombre}). discovered=None si no
+    se descubrió la lista en esta ejecución. Devuelve {'summary', 'forms'}.
+    """
+    keys = set(official) | set(tried) | set(files) | set(discovered or ())
+    forms = []
+    # El formulario base antes que sus suplementos
+    for key in sorted(keys, key=lambda k: (k[0], k[1] is not None, k[1] or '')):
+        row = {
+            'form': form_name(*key),
+            'official': key in official,
+            'discovered': key in discovered if discovered is not None else None,
+            'tried': key in tried,
+            'downloaded': key in downloaded,
+            'file': key in files,
+        }
+        if row['downloaded'] and not row['file']:
+            row['status'] = 'no_file'
+        elif row['downloaded']:
+            row['status'] = 'ok' if row['official'] else 'extra'
+        elif row['official']:
+            row['status'] = 'missing'
+        elif row['file']:
+            row['status'] = 'untracked'
+        elif row['discovered']:
+            row['status'] = 'new'
+        else:
+            row['status'] = 'not_found'
+        forms.append(row)
+
+    counts = {status: 0 for status in STATUSES}
+    for row in forms:
+        counts[row['status']] += 1
+    summary = {
+        'official': len(official),
+        'downloaded': len(downloaded),
+        'tried': len(tried),
+        'files': len(files),
+        'discovered': len(discovered) if discovered is not None else None,
+        'official_not_discovered': len(set(official) - set(discovered)) if discovered is not None else None,
+        'coverage': round(counts['ok'] / len(official) * 100, 1) if official else None,
+        **counts,
+    }
+    return {'summary': summary, 'forms': forms}
+
+
+def coverage(conn, pdfs_dir=PDFS_PATH, discovered=None, official=OFFICIAL_FORMS):
+    """Comparación completa a partir de la BD abierta y el directorio de PDF"""
+    tried, downloaded = load_db(conn)
+    files = index(os.path.splitext(name)[0] for name in scan_dir(pdfs_dir))
+    return diff(index(official), tried, downloaded, files,
+                index(discovered) if discovered is not None else None)
+
+
+def write_json(result, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+def write_csv(result, path):
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        for row in result['forms']:
+            writer.writerow({field: row[field] for field in CSV_FIELDS})
+
+
+def summary_line(result):
+    s = result['summary']
+    line = f"Cobertura: {s['ok']}/{s['official']} ({s['coverage']}%), faltantes {s['missing']}, extra {s['extra']}"
+    if s['no_file'] or s['untracked']:
+        line += f", sin PDF {s['no_file']}, PDF sin registro {s['untracked']}"
+    if s['discovered'] is not None:
+        line += f", nuevos en USCIS {s['new']}, oficiales no publicados {s['official_not_discovered']}"
+    return line
+
+
+def format_text(result):
+    """Reporte de texto (el formato de comparison_report.txt)"""
+    s = result['summary']
+    by_status = {}
+    for row in result['forms']:
+        by_status.setdefault(row['status'], []).append(row)
+
+    lines = ["=" * 80, "COMPARACION: Formularios Descargados vs Lista Oficial USCIS", "=" * 80, ""]
+    lines.append("ESTADISTICAS")
+    lines.append(f"  Lista oficial USCIS: {s['official']} formularios unicos")
+    lines.append(f"  Descargados exitosamente: {s['downloaded']} formularios")
+    lines.append(f"  Intentados total: {s['tried']} formularios")
+    lines.append(f"  PDF en disco: {s['files']}")
+    if s['discovered'] is not None:
+        lines.append(f"  Publicados en USCIS: {s['discovered']}")
+
+    for status, label in STATUSES.items():
+        rows = by_status.get(status)
+        if not rows or status == 'not_found':
+            continue
+        lines.append(f"\n[{status.upper()}] {label}: {len(rows)}")
+        for row in rows:
+            note = ''
+            if status == 'missing':
+                note = ' (intentado sin exito)' if row['tried'] else ' (no intentado)'
+            lines.append(f"   {row['form']:22}{note}".rstrip())
+
+    lines += ["", "=" * 80, "RESUMEN", "=" * 80, summary_line(result), "=" * 80]
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Comparar lista oficial, USCIS, BD y PDF en disco')
+    parser.add_argument('--official', help='lista oficial alternativa (un formulario por línea o JSON)')
+    parser.add_argument('--snapshot', help='HTML guardado de la página de formularios para comparar lo publicado')
+    parser.add_argument('--discover', action='store_true', help='descargar la página de formularios y compararla')
+    parser.add_argument('--json', help='guardar el resultado en JSON')
+    parser.add_argument('--csv', help='guardar una fila por formulario en CSV')
+    parser.add_argument('--report', default=REPORT_PATH, help='reporte de texto')
+    args = parser.parse_args()
+
+    official = OFFICIAL_FORMS
+    if args.official:
+        with open(args.official, encoding='utf-8') as f:
+            text = f.read()
+        official = json.loads(text) if text.lstrip().startswith('[') else text.split('\n')
+        official = [name for name in official if name.strip()]
+
+    discovered = None
+    if args.snapshot or args.discover:
+        import form_discovery
+        session = None
+        if not args.snapshot:
+            from http_client import create_session
+            session = create_session()
+        discovered = [form['form_number'] for form in form_discovery.discover(session, args.snapshot)]
+
+    conn = forms_db.open_db(forms_db.DB_PATH)
+    result = coverage(conn, PDFS_PATH, discovered, official)
+    conn.close()
+
+    text = format_text(result)
+    with open(args.report, 'w', encoding='utf-8') as f:
+        f.write(text + '\n')
+    print(text)
+    print(f"\nReporte guardado en: {args.report}")
+    if args.json:
+        write_json(result, args.json)
+        print(f"JSON: {args.json}")
+    if args.csv:
+        write_csv(result, args.csv)
+        print(f"CSV: {args.csv}")
@@ -1,20 +1,21 @@
-import sqlite3
-import os
+import forms_db
+import forms_stats
 
-db = sqlite3.connect('uscis_forms/uscis_forms.db')
+db = forms_db.open_db(forms_db.DB_PATH)
 c = db.cursor()
 
-print("Total forms:", c.execute('SELECT COUNT(*) FROM forms').fetchone()[0])
+stats = forms_stats.read(db)
+print("Total forms:", stats['total'])
 print("\nBy status:")
-for row in c.execute('SELECT status, COUNT(*) FROM forms GROUP BY status'):
-    print(f"  {row[0]}: {row[1]}")
+for status, count in stats['status'].items():
+    print(f"  {status}: {count}")
 
 # Total size
-size = c.execute('SELECT SUM(file_size) FROM forms WHERE status="downloaded"').fetchone()[0] or 0
+size = stats['downloaded_bytes']
 print(f"\nTotal size: {size/(1024*1024):.2f} MB")
 
 # Count PDFs
-pdf_count = len([f for f in os.listdir('uscis_forms/pdfs') if f.endswith('.pdf')])
+pdf_count = forms_stats.count_pdfs('uscis_forms/pdfs')
 print(f"PDF files: {pdf_count}")
 
 # Sample
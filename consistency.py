@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Verificación de la base de datos contra los PDF en disco
+Un solo recorrido de uscis_forms/pdfs con os.scandir, cruzado en memoria con
+los formularios descargados: archivos faltantes, tamaños distintos de
+file_size, descargas más cortas que Content-Length y archivos sin registro.
+Con --hash compara el SHA-256 de cada PDF con forms.sha256; los hashes se
+guardan en file_hashes por (tamaño, mtime) y solo se recalculan los archivos
+que cambiaron, en un pool de procesos. --repair vuelve a poner en cola los
+formularios dañados y --download los descarga de nuevo.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import forms_db
+from pdf_store import PDFS_PATH, PdfStore, hash_file
+
+ISSUE_LABELS = {
+    'missing': 'sin archivo',
+    'size': 'tamaño distinto de file_size',
+    'truncated': 'más corto que Content-Length',
+    'hash': 'SHA-256 distinto',
+    'orphan': 'archivo sin registro en la BD',
+}
+
+# Problemas que se corrigen descargando de nuevo el formulario
+BROKEN = ('missing', 'size', 'truncated', 'hash')
+
+
+def scan_dir(pdfs_dir=PDFS_PATH):
+    """{nombre: (tamaño, mtime_ns)} de los PDF del directorio (un solo scandir)"""
+    files = {}
+    try:
+        with os.scandir(pdfs_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith('.pdf') and entry.is_file():
+                    stat = entry.stat()
+                    files[entry.name] = (stat.st_size, stat.st_mtime_ns)
+    except FileNotFoundError:
+        pass
+    return files
+
+
+def _hash_job(path):
+    return path, hash_file(path)
+
+
+def file_hashes(conn, pdfs_dir, files, workers=None):
+    """
+    {nombre: sha256} de 'files' (salida de scan_dir). Solo se leen los archivos
+    cuyo tamaño o mtime cambió desde la última vez; devuelve (hashes, leídos).
+    """
+    cached = {name: (size, mtime, digest) for name, size, mtime, digest
+              in conn.execute('SELECT filename, size, mtime_ns, sha256 FROM file_hashes')}
+    hashes = {}
+    pending = []
+    for name, (size, mtime) in files.items():
+        entry = cached.get(name)
+        if entry and entry[:2] == (size, mtime):
+            hashes[name] = entry[2]
+        else:
+            pending.append(name)
+
+    if pending:
+        paths = [os.path.join(pdfs_dir, name) for name in pending]
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for path, digest in pool.map(_hash_job, paths, chunksize=8):
+                hashes[os.path.basename(path)] = digest
+        now = datetime.now().isoformat()
+        with conn:
+            conn.executemany('INSERT OR REPLACE INTO file_hashes VALUES (?, ?, ?, ?, ?)',
+                             [(name, *files[name], hashes[name], now) for name in pending])
+    # Archivos que ya no existen
+    gone = [(name,) for name in cached if name not in files]
+    if gone:
+        with conn:
+            conn.executemany('DELETE FROM file_hashes WHERE filename = ?', gone)
+    return hashes, len(pending)
+
+
+def check(conn, pdfs_dir=PDFS_PATH, verify_hashes=False, workers=None):
+    """
+    Cruzar los formularios descargados con los archivos. Devuelve
+    {'records', 'files', 'hashed', 'issues': [{'form', 'file', 'kind', 'detail'}]}
+    """
+    files = scan_dir(pdfs_dir)
+    rows = conn.execute('''
+        SELECT form_number, COALESCE(pdf_filename, form_number || '.pdf'), file_size, content_length, sha256
+        FROM forms
+        WHERE status='downloaded'
+    ''').fetchall()
+
+    hashes, hashed = {}, 0
+    if verify_hashes:
+        hashes, hashed = file_hashes(conn, pdfs_dir, files, workers)
+
+    issues = []
+    referenced = set()
+    for number, filename, size, length, digest in rows:
+        referenced.add(filename)
+        found = files.get(filename)
+        if found is None:
+            issues.append({'form': number, 'file': filename, 'kind': 'missing', 'detail': None})
+            continue
+        actual = found[0]
+        if length and actual < length:
+            issues.append({'form': number, 'file': filename, 'kind': 'truncated',
+                           'detail': f'{actual:,} de {length:,} bytes'})
+        elif size is not None and actual != size:
+            issues.append({'form': number, 'file': filename, 'kind': 'size',
+                           'detail': f'{actual:,} bytes, BD {size:,}'})
+        elif digest and filename in hashes and hashes[filename] != digest:
+            issues.append({'form': number, 'file': filename, 'kind': 'hash',
+                           'detail': f'{hashes[filename][:12]}…, BD {digest[:12]}…'})
+
+    for filename in sorted(set(files) - referenced):
+        issues.append({'form': None, 'file': filename, 'kind': 'orphan', 'detail': None})
+
+    return {'records': len(rows), 'files': len(files), 'hashed': hashed, 'issues': issues}
+
+
+def repair(conn, issues, pdfs_dir=PDFS_PATH, store=None):
+    """
+    Poner en cola de nuevo los formularios dañados: se borran el archivo, el
+    .part y el objeto del almacén si está corrupto, y se limpian los
+    validadores para que el próximo GET sea completo. Devuelve los formularios.
+    """
+    store = store or PdfStore()
+    broken = {}
+    for issue in issues:
+        if issue['kind'] in BROKEN:
+            broken.setdefault(issue['form'], issue)
+
+    for number, issue in broken.items():
+        path = os.path.join(pdfs_dir, issue['file'])
+        digest = conn.execute('SELECT sha256 FROM forms WHERE form_number = ?', (number,)).fetchone()[0]
+        # El enlace duro comparte el inodo con el objeto: si el PDF está dañado, el objeto también
+        if digest and issue['kind'] == 'hash' and store.has(digest) and not store.verify(digest):
+            os.remove(store.path_for(digest))
+        for stale in (path, path + '.part'):
+            if os.path.lexists(stale):
+                os.remove(stale)
+
+    with conn:
+        conn.executemany('''
+            UPDATE forms
+            SET status='pending', etag=NULL, last_modified=NULL, content_length=NULL
+            WHERE form_number = ?
+        ''', [(number,) for number in broken])
+        conn.executemany('DELETE FROM file_hashes WHERE filename = ?',
+                         [(issue['file'],) for issue in broken.values()])
+    return sorted(broken)
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Verificar la BD contra los PDF en disco')
+    parser.add_argument('--hash', action='store_true', help='comparar también el SHA-256 (solo archivos cambiados)')
+    parser.add_argument('--workers', type=int, default=None, help='procesos para calcular hashes')
+    parser.add_argument('--repair', action='store_true', help='volver a poner en cola los formularios dañados')
+    parser.add_argument('--download', action='store_true', help='con --repair, descargarlos ahora')
+    args = parser.parse_args()
+
+    conn = forms_db.open_db(forms_db.DB_PATH)
+    start = time.perf_counter()
+    report = check(conn, PDFS_PATH, args.hash, args.workers)
+    elapsed = time.perf_counter() - start
+
+    print(f"Registros descargados: {report['records']}")
+    print(f"Archivos PDF: {report['files']}")
+    if args.hash:
+        print(f"Hashes calculados: {report['hashed']} (el resto sin cambios desde la última verificación)")
+    print(f"Tiempo: {elapsed:.2f} s")
+
+    issues = report['issues']
+    for issue in issues:
+        detail = f" ({issue['detail']})" if issue['detail'] else ''
+        print(f"  ✗ {issue['form'] or '-':10} {issue['file']:20} {ISSUE_LABELS[issue['kind']]}{detail}")
+    if not issues:
+        print("✓ La base de datos y los archivos coinciden")
+
+    requeued = []
+    if args.repair:
+        requeued = repair(conn, issues, PDFS_PATH)
+        print(f"\nEn cola para descargar de nuevo: {len(requeued)} {' '.join(requeued)}")
+    conn.close()
+
+    if requeued and args.download:
+        from quick_download import QuickDownloader
+        QuickDownloader().run(requeued)
+    elif requeued:
+        print("Ejecuta python quick_download.py (o --download) para descargarlos")
+
+    if issues and not args.repair:
+        raise SystemExit(1)
@@ -1,7 +1,8 @@
-import sqlite3
-import os
+import consistency
+import forms_db
+import forms_stats
 
-conn = sqlite3.connect('uscis_forms/uscis_forms.db')
+conn = forms_db.open_db(forms_db.DB_PATH)
 c = conn.cursor()
 
 output = []
@@ -9,33 +10,31 @@ output.append("=" * 70)
 output.append("RESUMEN DE BASE DE DATOS USCIS")
 output.append("=" * 70)
 
-# Totales
-total = c.execute('SELECT COUNT(*) FROM forms').fetchone()[0]
-downloaded = c.execute("SELECT COUNT(*) FROM forms WHERE status='downloaded'").fetchone()[0]
-failed = c.execute("SELECT COUNT(*) FROM forms WHERE status='not_found'").fetchone()[0]
+# Totales (estadísticas materializadas: una sola lectura)
+stats = forms_stats.read(conn)
+total = stats['total']
+downloaded = stats['downloaded']
+failed = stats['status'].get('not_found', 0)
 
 output.append(f"\nTotal registros: {total}")
 output.append(f"Descargados: {downloaded}")
 output.append(f"No encontrados: {failed}")
 
 # Tamaño
-size = c.execute("SELECT SUM(file_size) FROM forms WHERE status='downloaded'").fetchone()[0] or 0
+size = stats['downloaded_bytes']
 output.append(f"\nTamanio total: {size/(1024*1024):.2f} MB")
 
 # PDFs físicos
-pdfs = len([f for f in os.listdir('uscis_forms/pdfs') if f.endswith('.pdf')])
-output.append(f"Archivos PDF fisicos: {pdfs}")
+check = consistency.check(conn, 'uscis_forms/pdfs')
+output.append(f"Archivos PDF fisicos: {check['files']}")
 
-# Consistencia
-status_check = 'OK' if pdfs == downloaded else 'ERROR'
+# Consistencia (archivo por archivo: faltantes, tamaños, sin registro)
+status_check = 'OK' if not check['issues'] else f"ERROR ({len(check['issues'])} problemas, ver consistency.py)"
 output.append(f"\nConsistencia BD/Archivos: {status_check}")
 
 # Por serie
 output.append("\nFormularios descargados por serie:")
-series = {}
-for (num,) in c.execute("SELECT form_number FROM forms WHERE status='downloaded'"):
-    prefix = num.split('-')[0] if '-' in num else 'Otros'
-    series[prefix] = series.get(prefix, 0) + 1
+series = stats['series']
 
 for prefix in sorted(series.keys()):
     output.append(f"  {prefix:8}: {series[prefix]:3} formularios")
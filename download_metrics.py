@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Métricas de descarga por formulario
+Cada petición de los descargadores genera un evento con DNS, conexión, TLS,
+espera (TTFB), transferencia, bytes, código HTTP, patrón de URL y
+reintentos. Los eventos se escriben en un log JSON Lines mientras ocurren y
+en download_events al terminar; el resumen muestra percentiles, el tiempo por
+patrón, los formularios más lentos y avisa si la velocidad cae frente a la
+ejecución anterior.
+"""
+
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import forms_db
+import http_client
+
+LOG_NAME = 'download_events.jsonl'
+
+EVENT_FIELDS = ('run_id', 'ts', 'source', 'form_number', 'url', 'pattern', 'status', 'bytes',
+                'dns_ms', 'connect_ms', 'tls_ms', 'ttfb_ms', 'transfer_ms', 'total_ms', 'retries', 'error')
+
+# Aviso si la velocidad por descarga baja de esta fracción de la ejecución anterior
+THROUGHPUT_DROP = 0.5
+
+
+def percentile(values, pct):
+    """Percentil por rango más cercano (values sin ordenar; 0.0 si está vacío)"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[max(0, math.ceil(pct * len(values) / 100) - 1)]
+
+
+class DownloadMetrics:
+    """Eventos de una ejecución (los hilos de descarga registran, run() guarda)"""
+
+    def __init__(self, source, log_path=None):
+        self.source = source
+        self.run_id = f"{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}"
+        self.events = []
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.log = open(log_path, 'a', encoding='utf-8') if log_path else None
+
+    @contextmanager
+    def request(self, form_number, url, pattern=None):
+        """
+        Medir una descarga; el bloque completa event['status'] y event['bytes'].
+        Las excepciones quedan en event['error'] y se propagan.
+        """
+        event = {'form_number': form_number, 'url': url, 'pattern': pattern, 'status': None,
+                 'bytes': 0, 'error': None}
+        start = time.perf_counter()
+        with http_client.trace() as timing:
+            try:
+                yield event
+            except Exception as e:
+                event['error'] = f'{type(e).__name__}: {e}'
+                raise
+            finally:
+                event['total_ms'] = (time.perf_counter() - start) * 1000
+                for field in http_client.TRACE_FIELDS:
+                    event[field] = timing[field]
+                event['retries'] = timing['retries']
+                self.record(event)
+
+    def record(self, event):
+        event = {field: event.get(field) for field in EVENT_FIELDS} | {
+            'run_id': self.run_id,
+            'ts': datetime.now().isoformat(),
+            'source': self.source,
+        }
+        for field in http_client.TRACE_FIELDS + ('total_ms',):
+            event[field] = round(event[field] or 0.0, 2)
+        with self.lock:
+            self.events.append(event)
+            if self.log:
+                self.log.write(json.dumps(event) + '\n')
+                self.log.flush()
+
+    def save(self, conn):
+        """Guardar los eventos en download_events (una transacción)"""
+        placeholders = ', '.join('?' * len(EVENT_FIELDS))
+        with conn:
+            conn.executemany(f'INSERT INTO download_events ({", ".join(EVENT_FIELDS)}) VALUES ({placeholders})',
+                             [tuple(event[field] for field in EVENT_FIELDS) for event in self.events])
+
+    def close(self):
+        if self.log:
+            self.log.close()
+            self.log = None
+
+    def summary(self, conn=None):
+        """Resumen de la ejecución; con conn compara la velocidad con la ejecución anterior"""
+        result = summarize(self.events, time.perf_counter() - self.started)
+        if conn is not None:
+            result['previous_bytes_per_s'] = previous_throughput(conn, self.source, self.run_id)
+        return result
+
+
+def summarize(events, wall_seconds=None):
+    totals = [e['total_ms'] for e in events]
+    ttfb = [e['ttfb_ms'] for e in events]
+    ok = [e for e in events if e['status'] == 200]
+    downloaded_bytes = sum(e['bytes'] or 0 for e in ok)
+    busy_ms = sum(e['total_ms'] for e in ok)
+
+    patterns = {}
+    for e in events:
+        entry = patterns.setdefault(e['pattern'] or '-', {'requests': 0, 'hits': 0, 'seconds': 0.0})
+        entry['requests'] += 1
+        entry['hits'] += e['status'] in (200, 304)
+        entry['seconds'] += e['total_ms'] / 1000
+
+    forms = {}
+    for e in events:
+        forms[e['form_number']] = forms.get(e['form_number'], 0.0) + e['total_ms'] / 1000
+
+    return {
+        'requests': len(events),
+        'status': {str(s): sum(1 for e in events if e['status'] == s)
+                   for s in sorted({e['status'] for e in events}, key=str)},
+        'errors': sum(1 for e in events if e['error']),
+        'retries': sum(e['retries'] or 0 for e in events),
+        'bytes': downloaded_bytes,
+        'wall_seconds': round(wall_seconds, 2) if wall_seconds is not None else None,
+        # Velocidad por descarga (bytes / tiempo de las respuestas 200): no depende de los hilos
+        'bytes_per_s': round(downloaded_bytes * 1000 / busy_ms) if busy_ms else None,
+        'p50_ms': round(percentile(totals, 50), 1),
+        'p95_ms': round(percentile(totals, 95), 1),
+        'p99_ms': round(percentile(totals, 99), 1),
+        'ttfb_p50_ms': round(percentile(ttfb, 50), 1),
+        'ttfb_p99_ms': round(percentile(ttfb, 99), 1),
+        'patterns': dict(sorted(patterns.items(), key=lambda item: -item[1]['seconds'])),
+        'slowest': sorted(forms.items(), key=lambda item: -item[1])[:5],
+    }
+
+
+def previous_throughput(conn, source, run_id):
+    """Velocidad por descarga de la ejecución anterior de este descargador (None si no hay)"""
+    row = conn.execute('''
+        SELECT SUM(bytes) * 1000.0 / SUM(total_ms)
+        FROM download_events
+        WHERE run_id = (
+            SELECT run_id FROM download_events
+            WHERE source = ? AND run_id != ? AND status = 200
+            ORDER BY id DESC LIMIT 1
+        ) AND status = 200
+    ''', (source, run_id)).fetchone()
+    return round(row[0]) if row and row[0] else None
+
+
+def format_summary(summary):
+    lines = [f"Peticiones: {summary['requests']} {summary['status']}, "
+             f"reintentos {summary['retries']}, errores {summary['errors']}"]
+    speed = summary['bytes_per_s']
+    lines.append(f"Bytes: {summary['bytes']:,}" + (f" ({speed / 1e6:.2f} MB/s por descarga)" if speed else ''))
+    lines.append(f"Latencia: p50 {summary['p50_ms']} ms, p95 {summary['p95_ms']} ms, p99 {summary['p99_ms']} ms "
+                 f"(TTFB p50 {summary['ttfb_p50_ms']} ms, p99 {summary['ttfb_p99_ms']} ms)")
+    for pattern, entry in list(summary['patterns'].items())[:3]:
+        lines.append(f"  {entry['seconds']:7.2f} s  {entry['hits']}/{entry['requests']}  {pattern}")
+    if summary['slowest']:
+        lines.append("Más lentos: " + ', '.join(f"{form} {seconds:.2f} s" for form, seconds in summary['slowest']))
+    previous = summary.get('previous_bytes_per_s')
+    if previous and speed and speed < previous * THROUGHPUT_DROP:
+        lines.append(f"⚠ Velocidad {speed / 1e6:.2f} MB/s, la ejecución anterior {previous / 1e6:.2f} MB/s")
+    return '\n'.join(lines)
+
+
+def load_events(conn, run_id=None):
+    """Eventos de una ejecución (por defecto la última) desde download_events"""
+    if run_id is None:
+        row = conn.execute('SELECT run_id FROM download_events ORDER BY id DESC LIMIT 1').fetchone()
+        if row is None:
+            return None, []
+        run_id = row[0]
+    cursor = conn.execute(f'SELECT {", ".join(EVENT_FIELDS)} FROM download_events WHERE run_id = ? ORDER BY id',
+                          (run_id,))
+    return run_id, [dict(zip(EVENT_FIELDS, row)) for row in cursor]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Resumen de las métricas de descarga')
+    parser.add_argument('--run', help='run_id (por defecto la última ejecución)')
+    parser.add_argument('--runs', action='store_true', help='listar las ejecuciones con su velocidad')
+    args = parser.parse_args()
+
+    conn = forms_db.open_db(forms_db.DB_PATH)
+    if args.runs:
+        for run_id, source, requests, size, busy in conn.execute('''
+            SELECT run_id, source, COUNT(*), SUM(CASE WHEN status = 200 THEN bytes END),
+                   SUM(CASE WHEN status = 200 THEN total_ms END)
+            FROM download_events
+            GROUP BY run_id
+            ORDER BY MIN(id)
+        '''):
+            speed = f"{size / busy / 1000:.2f} MB/s" if busy else '-'
+            print(f"  {run_id:24} {source:14} {requests:5} peticiones  {speed}")
+    else:
+        run_id, events = load_events(conn, args.run)
+        if not events:
+            print("Sin eventos de descarga (ejecuta quick_download.py o uscis_scraper.py)")
+        else:
+            summary = summarize(events)
+            summary['previous_bytes_per_s'] = previous_throughput(conn, events[0]['source'], run_id)
+            print(f"Ejecución {run_id} ({events[0]['source']})")
+            print(format_summary(summary))
+    conn.close()
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Historial de ediciones de los formularios USCIS
+Cada contenido distinto (sha256) de un formulario es una edición en
+form_editions; la fecha de edición se lee del pie del PDF ("Edition 01/20/25").
+"""
+
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+
+import forms_db
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # sin pypdf las ediciones se registran sin fecha
+    PdfReader = None
+
+# pypdf avisa de cada PDF cifrado; no aporta nada aquí
+logging.getLogger('pypdf').setLevel(logging.ERROR)
+
+PDFS_PATH = 'uscis_forms/pdfs'
+
+EDITION_RE = re.compile(r'Edition\s+(\d{1,2})/(\d{1,2})/(\d{2}|\d{4})\b')
+
+
+def parse_edition_date(text):
+    """'Form I-485  Edition 01/20/25  Page 1 of 20' -> '2025-01-20' (None si no aparece)"""
+    match = EDITION_RE.search(text or '')
+    if not match:
+        return None
+    month, day, year = (int(part) for part in match.groups())
+    if year < 100:
+        year += 2000
+    try:
+        return datetime(year, month, day).date().isoformat()
+    except ValueError:
+        return None
+
+
+def read_edition_date(path):
+    """Fecha de edición del PDF: el pie de la primera página (o de la última)"""
+    if PdfReader is None:
+        return None
+    try:
+        reader = PdfReader(path)
+        for page in (reader.pages[0], reader.pages[-1]):
+            edition = parse_edition_date(page.extract_text())
+            if edition:
+                return edition
+    except Exception as e:
+        print(f"  ✗ No se pudo leer la edición de {os.path.basename(path)}: {e}")
+    return None
+
+
+def backfill(conn, pdfs_dir=PDFS_PATH):
+    """
+    Registrar como primera edición los formularios descargados que aún no
+    tienen historial (first_seen = fecha de descarga). Devuelve cuántos.
+    """
+    rows = conn.execute('''
+        SELECT f.form_number, f.pdf_filename, f.sha256, f.file_size, f.download_date
+        FROM forms f
+        WHERE f.status='downloaded' AND f.sha256 IS NOT NULL
+          AND NOT EXISTS (SELECT 1 FROM form_editions e
+                          WHERE e.form_number = f.form_number AND e.sha256 = f.sha256)
+    ''').fetchall()
+    now = datetime.now().isoformat()
+    added = 0
+    for number, filename, sha256, size, download_date in rows:
+        path = os.path.join(pdfs_dir, filename or f'{number}.pdf')
+        edition = read_edition_date(path) if os.path.exists(path) else None
+        with conn:
+            conn.execute('''
+                INSERT OR IGNORE INTO form_editions
+                    (form_number, sha256, file_size, edition_date, first_seen, last_seen)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (number, sha256, size, edition, download_date or now, now))
+            if edition:
+                conn.execute('UPDATE forms SET edition_date = ? WHERE form_number = ?', (edition, number))
+        added += 1
+    return added
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Ediciones nuevas de formularios USCIS')
+    parser.add_argument('--since', help='fecha u hora ISO (por defecto: últimos --days días)')
+    parser.add_argument('--days', type=int, default=7)
+    parser.add_argument('--backfill', action='store_true',
+                        help='registrar el historial de los PDF descargados antes de esta versión')
+    args = parser.parse_args()
+
+    conn = forms_db.open_db(forms_db.DB_PATH)
+    if args.backfill:
+        print(f"Ediciones registradas: {backfill(conn, PDFS_PATH)}")
+
+    since = args.since or (datetime.now() - timedelta(days=args.days)).isoformat()
+    try:
+        since = forms_db.iso_timestamp(since)
+    except ValueError:
+        parser.error('--since debe ser una fecha ISO (AAAA-MM-DD)')
+    changes = forms_db.changes_since(conn, since)
+    conn.close()
+
+    print(f"\nEdiciones nuevas desde {since}: {len(changes)}")
+    for number, edition, _, size, first_seen, previous, previous_sha in changes:
+        if previous_sha is None:
+            print(f"  + {number:<10} {edition or '?':<10} (nuevo)  {first_seen[:16]}")
+        else:
+            print(f"  ~ {number:<10} {previous or '?'} → {edition or '?'}  {first_seen[:16]}")
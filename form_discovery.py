@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Descubrimiento de formularios a partir del HTML de "Todos los formularios"
+Extrae número, título, página y PDF de cada formulario con lxml, desde la
+página descargada con requests o desde una copia guardada (page_source.html),
+sin abrir un navegador.
+"""
+
+import re
+import time
+from urllib.parse import urljoin
+
+import lxml.html
+
+FORMS_PAGE_URL = 'https://www.uscis.gov/es/formularios/todos-los-formularios'
+PDF_URL = 'https://www.uscis.gov/sites/default/files/document/forms/{form}.pdf'
+
+# "I-485, Solicitud de Registro..." / "EOIR-29, ..." / "G-1041A" / "I-485 Supplement A | ..."
+FORM_LINK_RE = re.compile(r'^([A-Z]{1,4}-\d+[A-Z]{0,4})\b'
+                          r'(\s+(?i:supplement|suplemento)\b\s*([A-Z](?![\w-]))?)?'
+                          r'\s*[,|:–-]?\s*(.*)$')
+
+# Menos que esto significa que la página no trae la lista en el HTML
+# (contenido generado con JavaScript o una página de error)
+MIN_FORMS = 20
+
+
+def form_name(number, supplement=None):
+    """Nombre canónico: 'I-485', 'I-485 Supplement A', 'G-845 Supplement'"""
+    if supplement is None:
+        return number
+    return f'{number} Supplement {supplement}'.rstrip()
+
+
+def split_form_name(name):
+    """
+    'I-485 Supplement A' -> ('I-485', 'A'); 'G-845 Supplement' -> ('G-845', '');
+    'i-485' -> ('I-485', None). None si el texto no empieza con un número de formulario.
+    """
+    match = FORM_LINK_RE.match(' '.join(name.split()).upper())
+    if not match or match.group(4):
+        # Texto adicional ('G-639-1'): no es solo un nombre de formulario
+        return None
+    return match.group(1), _supplement(match)
+
+
+def _supplement(match):
+    # None: formulario base; '': suplemento sin letra; 'A': Supplement A
+    return (match.group(3) or '') if match.group(2) else None
+
+
+def pdf_name(number, supplement=None):
+    """Nombre del PDF en uscis.gov: 'i-485', 'i-485supa', 'g-845supplement'"""
+    if supplement is None:
+        return number.lower()
+    return f"{number.lower()}{'sup' + supplement.lower() if supplement else 'supplement'}"
+
+
+def parse_forms_html(html, base_url=FORMS_PAGE_URL):
+    """
+    Formularios encontrados en el HTML, en orden de aparición:
+    [{'form_number', 'title', 'url', 'pdf_url', 'source'}]
+    """
+    doc = lxml.html.fromstring(html)
+    forms = {}
+    for link in doc.iter('a'):
+        href = link.get('href')
+        if not href:
+            continue
+        text = ' '.join(link.text_content().split())
+        match = FORM_LINK_RE.match(text)
+        if not match:
+            continue
+        # Los suplementos son formularios aparte ("I-485 Supplement A"), no el I-485
+        number = form_name(match.group(1).upper(), _supplement(match))
+        title = match.group(4)
+        url = urljoin(base_url, href)
+
+        form = forms.get(number)
+        if form is None:
+            form = forms[number] = {
+                'form_number': number,
+                'title': title or number,
+                'url': url,
+                'pdf_url': None,
+                'source': 'html',
+            }
+        elif title and form['title'] == number:
+            form['title'] = title
+        if url.lower().endswith('.pdf'):
+            form['pdf_url'] = url
+
+    # La lista enlaza a la página de cada formulario; el PDF sigue la ruta habitual
+    for form in forms.values():
+        if not form['pdf_url']:
+            form['pdf_url'] = PDF_URL.format(form=pdf_name(*split_form_name(form['form_number'])))
+    return list(forms.values())
+
+
+def fetch_forms_page(session, url=FORMS_PAGE_URL, timeout=15):
+    """HTML de la página de formularios (None si no responde 200)"""
+    response = session.get(url, timeout=timeout)
+    if response.status_code != 200:
+        print(f"  ✗ HTTP {response.status_code} en {url}")
+        return None
+    return response.text
+
+
+def discover(session=None, snapshot=None, url=FORMS_PAGE_URL):
+    """
+    Formularios desde una copia guardada (snapshot) o desde la página en línea.
+    Devuelve [] si el HTML no trae la lista (el llamador puede usar el navegador).
+    """
+    start = time.perf_counter()
+    if snapshot:
+        with open(snapshot, encoding='utf-8') as f:
+            html = f.read()
+    else:
+        html = fetch_forms_page(session, url)
+        if html is None:
+            return []
+    forms = parse_forms_html(html, url)
+    elapsed = time.perf_counter() - start
+    print(f"  {len(forms)} formularios en el HTML ({elapsed * 1000:.0f} ms)")
+    return forms if len(forms) >= MIN_FORMS else []
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Formularios listados en la página de USCIS')
+    parser.add_argument('--snapshot', help='HTML guardado (p. ej. uscis_forms/page_source.html)')
+    args = parser.parse_args()
+
+    session = None
+    if not args.snapshot:
+        from http_client import create_session
+        session = create_session()
+    for form in discover(session, args.snapshot):
+        print(f"  {form['form_number']:<10} {form['title'][:70]}")
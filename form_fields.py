@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Esquema de campos AcroForm de los formularios USCIS
+Por cada campo rellenable: nombre completo, nombre corto, tipo, página,
+descripción (/TU), longitud máxima y opciones. pdf_extract.py lo extrae junto
+con el resto de metadatos y lo guarda en form_fields.
+"""
+
+import json
+import re
+
+import forms_db
+
+# Bits de /Ff (PDF 32000-1, 12.7.4)
+FF_READONLY = 1 << 0
+FF_RADIO = 1 << 15
+FF_PUSHBUTTON = 1 << 16
+FF_COMBO = 1 << 17
+
+
+def _inherited(field, key):
+    """Valor de un atributo heredable (/FT, /Ff, /Opt...) subiendo por /Parent"""
+    while field is not None:
+        if key in field:
+            return field[key]
+        field = field.get('/Parent')
+        field = field.get_object() if field is not None else None
+    return None
+
+
+def full_name(field):
+    """'form1[0].#subform[0].Pt1Line1a_FamilyName[0]': los /T desde la raíz"""
+    parts = []
+    while field is not None:
+        if '/T' in field:
+            parts.append(str(field['/T']))
+        field = field.get('/Parent')
+        field = field.get_object() if field is not None else None
+    return '.'.join(reversed(parts))
+
+
+def short_name(name):
+    """'form1[0].#subform[0].Pt1Line1a_FamilyName[0]' -> 'Pt1Line1a_FamilyName'"""
+    return re.sub(r'\[\d+\]$', '', name.rsplit('.', 1)[-1])
+
+
+def field_type(ft, flags):
+    if ft == '/Tx':
+        return 'text'
+    if ft == '/Ch':
+        return 'combo' if flags & FF_COMBO else 'list'
+    if ft == '/Btn':
+        if flags & FF_PUSHBUTTON:
+            return 'button'
+        return 'radio' if flags & FF_RADIO else 'checkbox'
+    if ft == '/Sig':
+        return 'signature'
+    return None
+
+
+def _choice_options(opt):
+    # /Opt: cada opción es un texto o un par [valor exportado, texto mostrado]
+    options = []
+    for item in opt or []:
+        item = item.get_object() if hasattr(item, 'get_object') else item
+        options.append(str(item[0] if isinstance(item, list) else item))
+    return options
+
+
+def iter_widgets(reader):
+    """
+    (página, widget, referencia del widget, campo, referencia del campo) de
+    cada widget de formulario. El widget es el campo mismo o un hijo sin /T.
+    """
+    for page_number, page in enumerate(reader.pages, 1):
+        annots = page.get('/Annots')
+        for widget_ref in annots.get_object() if annots is not None else []:
+            widget = widget_ref.get_object()
+            if widget.get('/Subtype') != '/Widget':
+                continue
+            field_ref = widget_ref if '/T' in widget else widget.raw_get('/Parent')
+            if field_ref is None:
+                continue
+            yield page_number, widget, widget_ref, field_ref.get_object(), field_ref
+
+
+def on_state(widget):
+    """Estado de apariencia "encendido" de una casilla o botón de radio ('Y', '1'...)"""
+    states = (widget.get('/AP') or {}).get('/N') or {}
+    for state in states.keys():
+        state = str(state).lstrip('/')
+        if state != 'Off':
+            return state
+    return None
+
+
+def read_fields(reader):
+    """
+    Campos de un PdfReader, en orden de página. Los widgets de un mismo campo
+    (p. ej. los botones de un grupo de radio) se combinan en una sola entrada.
+    """
+    fields = {}
+    for page_number, widget, _, field, _ in iter_widgets(reader):
+        name = full_name(field)
+        if not name:
+            continue
+
+        entry = fields.get(name)
+        if entry is None:
+            flags = int(_inherited(field, '/Ff') or 0)
+            kind = field_type(_inherited(field, '/FT'), flags)
+            if kind is None:
+                continue
+            max_length = _inherited(field, '/MaxLen')
+            entry = fields[name] = {
+                'name': name,
+                'short_name': short_name(name),
+                'type': kind,
+                'page': page_number,
+                'tooltip': str(field['/TU']) if '/TU' in field else None,
+                'max_length': int(max_length) if max_length is not None else None,
+                'readonly': bool(flags & FF_READONLY),
+                'options': _choice_options(_inherited(field, '/Opt')) if kind in ('combo', 'list') else [],
+            }
+        if entry['type'] in ('checkbox', 'radio'):
+            # Valores posibles: los estados de apariencia distintos de /Off
+            state = on_state(widget)
+            if state and state not in entry['options']:
+                entry['options'].append(state)
+    return list(fields.values())
+
+
+def save_fields(conn, form_number, fields):
+    """Reemplazar los campos de un formulario (en la transacción del llamador)"""
+    conn.execute('DELETE FROM form_fields WHERE form_number = ?', (form_number,))
+    conn.executemany('''
+        INSERT INTO form_fields
+            (form_number, name, short_name, field_type, page, tooltip, max_length, readonly, options)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(form_number, f['name'], f['short_name'], f['type'], f['page'], f['tooltip'],
+           f['max_length'], int(f['readonly']), json.dumps(f['options']) if f['options'] else None)
+          for f in fields])
+
+
+def row_to_dict(row):
+    """Fila de forms_db.form_field_schema / find_fields -> dict para la API"""
+    form_number, name, short, kind, page, tooltip, max_length, readonly, options = row
+    return {
+        'form': form_number,
+        'name': name,
+        'short_name': short,
+        'type': kind,
+        'page': page,
+        'tooltip': tooltip,
+        'max_length': max_length,
+        'readonly': bool(readonly),
+        'options': json.loads(options) if options else [],
+    }
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Campos rellenables de un formulario USCIS')
+    parser.add_argument('form_number', help='p. ej. I-130')
+    parser.add_argument('--name', help='solo los campos con este nombre corto o completo')
+    args = parser.parse_args()
+
+    conn = forms_db.open_db(forms_db.DB_PATH)
+    rows = forms_db.form_field_schema(conn, args.form_number, args.name)
+    conn.close()
+
+    if not rows:
+        print(f"Sin campos indexados para {args.form_number} (ejecuta python pdf_extract.py)")
+    for row in rows:
+        field = row_to_dict(row)
+        extra = f" {field['options']}" if field['options'] else ''
+        print(f"  p{field['page']:<3} {field['type']:<9} {field['short_name']:<40} "
+              f"{(field['tooltip'] or '')[:60]}{extra}")
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Relleno de formularios USCIS en lote
+Cada PDF de uscis_forms/pdfs se analiza una sola vez por proceso (FormTemplate);
+rellenar es agregar al final del PDF original una actualización incremental con
+los campos modificados, sin volver a escribir el documento. Los trabajos se
+reparten en un pool de procesos, agrupados por formulario.
+
+Trabajos (JSON Lines), uno por formulario a rellenar:
+    {"case": "A-2025-001", "form": "I-130", "fields": {"Pt2Line4a_FamilyName": "García"}}
+    {"case": "A-2025-001", "form": "I-765", "data": {"client": {"last_name": "García"}}}
+Con "data", --mapping indica qué dato va en qué campo:
+    {"I-765": {"client.last_name": "Line1a_FamilyName"}}
+"""
+
+import io
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import form_fields
+
+try:
+    from pypdf import PdfReader
+    from pypdf.generic import BooleanObject, DictionaryObject, NameObject, TextStringObject
+except ImportError:  # pypdf es necesario para rellenar
+    PdfReader = None
+
+# pypdf avisa de cada PDF cifrado; no aporta nada al rellenar
+logging.getLogger('pypdf').setLevel(logging.ERROR)
+
+PDFS_PATH = 'uscis_forms/pdfs'
+OUTPUT_DIR = 'uscis_forms/filled'
+
+# Valores que marcan una casilla además de su propio estado ('Y', '1'...)
+CHECKED_VALUES = {'true', 'yes', 'si', 'sí', 'x', 'on', '1'}
+
+
+class FillError(Exception):
+    """El formulario no se puede rellenar (sin PDF, sin campos, sin pypdf)"""
+
+
+class FieldTarget:
+    """Un campo del PDF: su objeto y los widgets donde se dibuja"""
+
+    def __init__(self, name, kind, ref, field):
+        self.name = name
+        self.kind = kind
+        self.ref = ref
+        self.field = field
+        self.widgets = []  # (referencia, widget, estado "encendido")
+
+
+class FormTemplate:
+    """PDF de un formulario ya analizado; se rellena muchas veces sin volver a leerlo"""
+
+    def __init__(self, path):
+        if PdfReader is None:
+            raise FillError('pypdf no está instalado')
+        with open(path, 'rb') as f:
+            self.data = f.read()
+        reader = PdfReader(io.BytesIO(self.data))
+        if reader.is_encrypted:
+            # Los PDF de USCIS tienen contraseña de usuario vacía y permiten rellenar
+            reader.decrypt('')
+        # Los objetos nuevos se cifran con la clave del documento (API interna de pypdf)
+        self.encryption = reader._encryption if reader.is_encrypted else None
+        self.startxref = int(re.findall(rb'startxref\s+(\d+)', self.data[-2048:])[-1])
+
+        trailer = reader.trailer
+        self.size = int(trailer['/Size'])
+        self.trailer_refs = {key: trailer.raw_get(key) for key in ('/Root', '/Info', '/ID', '/Encrypt')
+                             if key in trailer}
+
+        self.fields = {}
+        self.by_short = {}
+        for _, widget, widget_ref, field, field_ref in form_fields.iter_widgets(reader):
+            name = form_fields.full_name(field)
+            target = self.fields.get(name)
+            if target is None:
+                flags = int(form_fields._inherited(field, '/Ff') or 0)
+                kind = form_fields.field_type(form_fields._inherited(field, '/FT'), flags)
+                if kind is None or kind in ('button', 'signature') or flags & form_fields.FF_READONLY:
+                    continue
+                target = self.fields[name] = FieldTarget(name, kind, field_ref, field)
+                self.by_short.setdefault(form_fields.short_name(name), []).append(name)
+            target.widgets.append((widget_ref, widget, form_fields.on_state(widget)))
+        if not self.fields:
+            raise FillError(f'{os.path.basename(path)} no tiene campos rellenables')
+
+        # AcroForm sin XFA (si no, los visores ignoran los valores) y con
+        # NeedAppearances para que dibujen los textos. Es igual en cada relleno.
+        root_ref = trailer.raw_get('/Root')
+        root = root_ref.get_object()
+        acroform_ref = root.raw_get('/AcroForm')
+        if hasattr(acroform_ref, 'idnum'):
+            patched_ref, patched = acroform_ref, DictionaryObject(acroform_ref.get_object())
+            acroform = patched
+        else:
+            patched_ref, patched = root_ref, DictionaryObject(root)
+            acroform = patched[NameObject('/AcroForm')] = DictionaryObject(acroform_ref)
+        acroform.pop('/XFA', None)
+        acroform[NameObject('/NeedAppearances')] = BooleanObject(True)
+        self.fixed_objects = {(patched_ref.idnum, patched_ref.generation): self.serialize(patched_ref, patched)}
+
+    def resolve(self, key):
+        """Nombres completos para un nombre corto o completo"""
+        if key in self.fields:
+            return [key]
+        return self.by_short.get(key, [])
+
+    def serialize(self, ref, obj):
+        if self.encryption is not None:
+            obj = self.encryption.encrypt_object(obj, ref.idnum, ref.generation)
+        out = io.BytesIO()
+        out.write(f'{ref.idnum} {ref.generation} obj\n'.encode())
+        obj.write_to_stream(out)
+        out.write(b'\nendobj\n')
+        return out.getvalue()
+
+    def fill(self, values):
+        """
+        Bytes del PDF relleno con {nombre corto o completo: valor}.
+        Devuelve (pdf, nombres que no corresponden a ningún campo rellenable).
+        """
+        changed = {}  # (idnum, gen) -> (referencia, copia del objeto)
+
+        def editable(ref, obj):
+            key = (ref.idnum, ref.generation)
+            if key not in changed:
+                changed[key] = (ref, DictionaryObject(obj))
+            return changed[key][1]
+
+        missing = []
+        for key, value in values.items():
+            names = self.resolve(key)
+            if not names:
+                missing.append(key)
+                continue
+            for name in names:
+                target = self.fields[name]
+                field = editable(target.ref, target.field)
+                if target.kind in ('checkbox', 'radio'):
+                    # Casilla: se marca con un valor "verdadero"; radio: con el estado de la opción
+                    text = str(value).strip()
+                    selected = 'Off'
+                    for widget_ref, widget, state in target.widgets:
+                        if target.kind == 'checkbox':
+                            on = value is True or text.lower() in CHECKED_VALUES or text == state
+                        else:
+                            on = text == state
+                        appearance = state if on and state else 'Off'
+                        editable(widget_ref, widget)[NameObject('/AS')] = NameObject('/' + appearance)
+                        if appearance != 'Off':
+                            selected = appearance
+                    field[NameObject('/V')] = NameObject('/' + selected)
+                else:
+                    field[NameObject('/V')] = TextStringObject('' if value is None else str(value))
+
+        return self.write_update(changed), missing
+
+    def write_update(self, changed):
+        """PDF original + objetos modificados + flujo de referencias cruzadas (/Prev)"""
+        out = io.BytesIO()
+        out.write(self.data)
+        if not self.data.endswith(b'\n'):
+            out.write(b'\n')
+        offsets = {}
+        for key, body in self.fixed_objects.items():
+            offsets[key] = out.tell()
+            out.write(body)
+        for key, (ref, obj) in changed.items():
+            if key in offsets:
+                continue
+            offsets[key] = out.tell()
+            out.write(self.serialize(ref, obj))
+
+        # Los PDF de USCIS usan flujos de referencias cruzadas (PDF 1.5):
+        # la actualización también, con una entrada tipo 1 por objeto
+        xref_number = self.size
+        offsets[(xref_number, 0)] = out.tell()
+        entries = sorted(offsets.items())
+        rows = b''.join(b'\x01' + offset.to_bytes(4, 'big') + gen.to_bytes(2, 'big')
+                        for (_, gen), offset in entries)
+        index = ' '.join(f'{number} 1' for (number, _), _ in entries)
+        header = [f'/Type /XRef /Size {xref_number + 1} /Index [{index}] /W [1 4 2]',
+                  f'/Prev {self.startxref} /Length {len(rows)}']
+        trailer = io.BytesIO()
+        for key, value in self.trailer_refs.items():
+            trailer.write(key.encode() + b' ')
+            value.write_to_stream(trailer)
+            trailer.write(b' ')
+        out.write(f'{xref_number} 0 obj\n<< {" ".join(header)} '.encode())
+        out.write(trailer.getvalue())
+        out.write(b'>>\nstream\n' + rows + b'\nendstream\nendobj\n')
+        out.write(f'startxref\n{offsets[(xref_number, 0)]}\n%%EOF\n'.encode())
+        return out.getvalue()
+
+
+# Plantillas ya analizadas en este proceso: (ruta, mtime, tamaño) -> FormTemplate
+_templates = {}
+
+
+def get_template(path):
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    template = _templates.get(key)
+    if template is None:
+        template = _templates[key] = FormTemplate(path)
+    return template
+
+
+def lookup(data, path):
+    """'client.last_name' -> data['client']['last_name'] (None si falta algún nivel)"""
+    for part in path.split('.'):
+        if not isinstance(data, dict):
+            return None
+        data = data.get(part)
+    return data
+
+
+def job_values(job, mapping):
+    """Valores de un trabajo: 'fields' tal cual, más 'data' traducido con el mapeo del formulario"""
+    values = dict(job.get('fields') or {})
+    for source, field in (mapping.get(job['form']) or {}).items():
+        value = lookup(job.get('data') or {}, source)
+        if value is not None:
+            values.setdefault(field, value)
+    return values
+
+
+def fill_job(args):
+    """Trabajo de un proceso del pool: (trabajo, mapeo, carpeta de PDF, carpeta de salida)"""
+    job, mapping, pdfs_dir, output_dir = args
+    form = job['form']
+    output = job.get('output') or os.path.join(output_dir, job.get('case') or 'sin_caso', f'{form}.pdf')
+    start = time.perf_counter()
+    try:
+        template = get_template(os.path.join(pdfs_dir, f'{form}.pdf'))
+        pdf, missing = template.fill(job_values(job, mapping))
+        os.makedirs(os.path.dirname(output) or '.', exist_ok=True)
+        tmp = output + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(pdf)
+        os.replace(tmp, output)
+        error = None
+    except (OSError, FillError) as e:
+        output, missing, error = None, [], str(e)
+    except Exception as e:
+        # PDF dañado (PdfReadError, NotImplementedError, IndexError...): falla este trabajo, no el lote
+        output, missing, error = None, [], f'{type(e).__name__}: {e}'
+    return {
+        'case': job.get('case'),
+        'form': form,
+        'output': output,
+        'missing': missing,
+        'error': error,
+        'ms': (time.perf_counter() - start) * 1000,
+    }
+
+
+def fill_batch(jobs, mapping=None, pdfs_dir=PDFS_PATH, output_dir=OUTPUT_DIR, workers=None):
+    """
+    Rellenar todos los trabajos; devuelve un resultado por trabajo, en el orden recibido.
+    Se ordenan por formulario para que cada proceso reutilice sus plantillas.
+    """
+    mapping = mapping or {}
+    order = sorted(range(len(jobs)), key=lambda i: jobs[i]['form'])
+    tasks = [(jobs[i], mapping, pdfs_dir, output_dir) for i in order]
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1 or len(tasks) <= 1:
+        results = list(map(fill_job, tasks))
+    else:
+        # Trozos grandes: cada proceso recibe trabajos seguidos del mismo formulario
+        chunksize = max(1, len(tasks) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(fill_job, tasks, chunksize=chunksize))
+
+    ordered = [None] * len(jobs)
+    for i, result in zip(order, results):
+        ordered[i] = result
+    return ordered
+
+
+def load_jobs(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Rellenar formularios USCIS en lote')
+    parser.add_argument('jobs', help='archivo JSON Lines con los trabajos')
+    parser.add_argument('--mapping', help='JSON {formulario: {dato: campo}} para los trabajos con "data"')
+    parser.add_argument('--out', default=OUTPUT_DIR, help='carpeta de salida (<caso>/<formulario>.pdf)')
+    parser.add_argument('--workers', type=int, default=None, help='procesos (por defecto, uno por núcleo)')
+    args = parser.parse_args()
+
+    jobs = load_jobs(args.jobs)
+    mapping = {}
+    if args.mapping:
+        with open(args.mapping, encoding='utf-8') as f:
+            mapping = json.load(f)
+
+    start = time.perf_counter()
+    results = fill_batch(jobs, mapping, PDFS_PATH, args.out, args.workers)
+    elapsed = time.perf_counter() - start
+
+    failed = [r for r in results if r['error']]
+    for r in failed:
+        print(f"  ✗ {r['case']} {r['form']}: {r['error']}")
+    for r in results:
+        if r['missing']:
+            print(f"  ⚠ {r['case']} {r['form']}: campos desconocidos o de solo lectura {', '.join(r['missing'])}")
+
+    filled = [r for r in results if not r['error']]
+    print(f"\nRellenados: {len(filled)}")
+    print(f"Con error: {len(failed)}")
+    print(f"Tiempo: {elapsed:.2f} s")
+    if filled:
+        times = sorted(r['ms'] for r in filled)
+        print(f"Por formulario: mediana {times[len(times) // 2]:.1f} ms (incluye analizar cada plantilla una vez)")
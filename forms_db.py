@@ -0,0 +1,718 @@
+#!/usr/bin/env python3
+"""
+Esquema, migraciones y consultas compartidas para uscis_forms.db
+
+Todos los scripts abren la base con open_db(), que aplica las migraciones
+pendientes (PRAGMA user_version), de modo que el esquema es el mismo sin
+importar qué descargador se ejecutó primero.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.request import pathname2url
+
+DB_PATH = 'uscis_forms/uscis_forms.db'
+
+PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA temp_store=MEMORY',
+    # INSERT OR REPLACE dispara los triggers de DELETE (forms_stats descuenta la fila reemplazada)
+    'PRAGMA recursive_triggers=ON',
+]
+
+
+READONLY_PRAGMAS = [
+    'PRAGMA query_only=ON',
+    'PRAGMA busy_timeout=5000',
+    'PRAGMA temp_store=MEMORY',
+]
+
+
+def connect(db_path=DB_PATH, readonly=False, **kwargs):
+    """
+    Abrir la base de datos con WAL y pragmas para escrituras concurrentes.
+    readonly=True abre en modo solo lectura (para los workers del servidor).
+    """
+    if readonly:
+        uri = f'file:{pathname2url(os.path.abspath(db_path))}?mode=ro'
+        conn = sqlite3.connect(uri, uri=True, **kwargs)
+        pragmas = READONLY_PRAGMAS
+    else:
+        conn = sqlite3.connect(db_path, **kwargs)
+        pragmas = PRAGMAS
+    for pragma in pragmas:
+        conn.execute(pragma)
+    return conn
+
+
+def open_db(db_path=DB_PATH, **kwargs):
+    """Abrir la base de datos y aplicar las migraciones pendientes"""
+    conn = connect(db_path, **kwargs)
+    migrate(conn)
+    return conn
+
+
+class ConnectionPool:
+    """Conexiones reutilizables entre hilos (una por petición a la vez)"""
+
+    def __init__(self, db_path=DB_PATH, size=8, readonly=False):
+        self.db_path = db_path
+        self.size = size
+        self.readonly = readonly
+        self.idle = queue.LifoQueue()
+        self.lock = threading.Lock()
+        # Las migraciones se aplican una vez con una conexión de escritura;
+        # en modo solo lectura esa conexión se cierra y el resto abre con mode=ro
+        conn = open_db(db_path, check_same_thread=False)
+        if readonly:
+            conn.close()
+            conn = connect(db_path, readonly=True, check_same_thread=False)
+        self.idle.put(conn)
+        self.created = 1
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                can_create = self.created < self.size
+                if can_create:
+                    self.created += 1
+            if can_create:
+                conn = connect(self.db_path, readonly=self.readonly, check_same_thread=False)
+            else:
+                conn = self.idle.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self.idle.put(conn)
+
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+# ---------------------------------------------------------------------------
+# Esquema y migraciones
+# ---------------------------------------------------------------------------
+
+# Columnas de forms (además de id y form_number); se agregan a bases antiguas
+FORMS_COLUMNS = {
+    'form_title': 'TEXT',
+    'form_description': 'TEXT',
+    'edition_date': 'TEXT',
+    'pdf_url': 'TEXT',
+    'pdf_filename': 'TEXT',
+    'instructions_url': 'TEXT',
+    'download_date': 'TEXT',
+    'file_size': 'INTEGER',
+    'category': 'TEXT',
+    'status': "TEXT DEFAULT 'pending'",
+}
+
+# Columnas para la sincronización incremental (validadores HTTP por formulario)
+SYNC_COLUMNS = {
+    'etag': 'TEXT',
+    'last_modified': 'TEXT',
+    'content_length': 'INTEGER',
+}
+
+# Serie del formulario: 'I-485' -> 'I', 'EOIR-29' -> 'EOIR'
+SERIES_SQL = ("CASE WHEN instr(form_number, '-') > 0 "
+              "THEN substr(form_number, 1, instr(form_number, '-') - 1) ELSE 'Otros' END")
+
+
+def ensure_columns(conn, table, columns):
+    """Agregar a una tabla existente las columnas que le falten"""
+    existing = {row[1] for row in conn.execute(f'PRAGMA table_info({table})')}
+    for name, col_type in columns.items():
+        if name not in existing:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {col_type}')
+
+
+def _migration_base_tables(conn):
+    columns = ',\n'.join(f'{name} {col_type}' for name, col_type in FORMS_COLUMNS.items())
+    conn.execute(f'''
+        CREATE TABLE IF NOT EXISTS forms (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            form_number TEXT UNIQUE,
+            {columns}
+        )
+    ''')
+    # quick_download.py creaba una tabla forms sin algunas columnas
+    ensure_columns(conn, 'forms', FORMS_COLUMNS)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS scrape_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            scrape_date TEXT,
+            total_forms INTEGER,
+            downloaded INTEGER,
+            failed INTEGER,
+            status TEXT
+        )
+    ''')
+
+
+def _migration_sync_columns(conn):
+    ensure_columns(conn, 'forms', SYNC_COLUMNS)
+
+
+def _migration_resolver_tables(conn):
+    # Caché de resolución de URL: qué URL funcionó para cada formulario (o que no existe)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS url_resolver (
+            form_number TEXT PRIMARY KEY,
+            url TEXT,
+            pattern TEXT,
+            found INTEGER,
+            checked_at TEXT,
+            expires_at TEXT
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS url_pattern_stats (
+            pattern TEXT PRIMARY KEY,
+            hits INTEGER DEFAULT 0,
+            misses INTEGER DEFAULT 0
+        )
+    ''')
+
+
+def _migration_indexes(conn):
+    # Todas las consultas de reportes y del servidor filtran por status
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_forms_status_number ON forms(status, form_number)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_forms_status_size ON forms(status, file_size)')
+    conn.execute(f'CREATE INDEX IF NOT EXISTS idx_forms_series ON forms(status, {SERIES_SQL})')
+
+
+def _migration_search_index(conn):
+    # Índice de texto completo: número, título, palabras clave y texto del PDF.
+    # remove_diacritics: "autorizacion" encuentra "autorización"
+    conn.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS forms_fts USING fts5(
+            form_number,
+            title,
+            keywords,
+            body,
+            tokenize = "unicode61 remove_diacritics 2",
+            prefix = '2 3'
+        )
+    ''')
+    # Qué versión de cada PDF está indexada (para no volver a extraer el texto)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS search_index_state (
+            form_number TEXT PRIMARY KEY,
+            file_mtime REAL,
+            file_size INTEGER,
+            indexed_at TEXT
+        )
+    ''')
+
+
+def _migration_catalog_version(conn):
+    # Contador que cambia con cada escritura en forms: marca de versión para cachés
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS catalog_version (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            version INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('INSERT OR IGNORE INTO catalog_version (id, version) VALUES (1, 1)')
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS forms_version_{event.lower()} AFTER {event} ON forms
+            BEGIN
+                UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+            END
+        ''')
+
+
+def _migration_content_store(conn):
+    # Hash del PDF de cada formulario y objetos guardados en pdf_store
+    ensure_columns(conn, 'forms', {'sha256': 'TEXT'})
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pdf_objects (
+            sha256 TEXT PRIMARY KEY,
+            size INTEGER,
+            stored_at TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_forms_sha256 ON forms(sha256)')
+
+
+def _migration_editions(conn):
+    # Historial de ediciones: una fila por cada contenido distinto de un formulario
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS form_editions (
+            form_number TEXT NOT NULL,
+            sha256 TEXT NOT NULL,
+            file_size INTEGER,
+            edition_date TEXT,
+            first_seen TEXT NOT NULL,
+            last_seen TEXT NOT NULL,
+            PRIMARY KEY (form_number, sha256)
+        )
+    ''')
+    # "Qué cambió desde X" y la edición anterior de cada formulario
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_editions_first_seen ON form_editions(first_seen)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_editions_form ON form_editions(form_number, first_seen)')
+
+
+def _migration_pdf_metadata(conn):
+    # Lo que pdf_extract.py lee de cada PDF; sha256 indica qué contenido se leyó
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pdf_metadata (
+            form_number TEXT PRIMARY KEY,
+            sha256 TEXT NOT NULL,
+            title TEXT,
+            page_count INTEGER,
+            edition_date TEXT,
+            language TEXT,
+            field_count INTEGER,
+            field_names TEXT,
+            extracted_at TEXT
+        )
+    ''')
+
+
+
+def _migration_form_fields(conn):
+    # Esquema AcroForm de cada formulario (form_fields.py)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS form_fields (
+            form_number TEXT NOT NULL,
+            name TEXT NOT NULL,
+            short_name TEXT,
+            field_type TEXT,
+            page INTEGER,
+            tooltip TEXT,
+            max_length INTEGER,
+            readonly INTEGER,
+            options TEXT,
+            PRIMARY KEY (form_number, name)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_form_fields_short ON form_fields(short_name, form_number)')
+    # Los PDF ya extraídos no tienen campos: se vuelven a leer en la próxima extracción
+    conn.execute('DELETE FROM pdf_metadata')
+
+
+def _stats_delta(row, sign):
+    # Sumar (sign=1) o restar (sign=-1) una fila de forms a su celda de forms_stats
+    return f'''
+        INSERT INTO forms_stats (status, series, forms, bytes)
+        VALUES (COALESCE({row}.status, 'pending'), {row}.series, {sign}, {sign} * COALESCE({row}.file_size, 0))
+        ON CONFLICT(status, series) DO UPDATE SET
+            forms = forms + excluded.forms,
+            bytes = bytes + excluded.bytes;
+    '''
+
+
+def _migration_stats(conn):
+    # Serie como columna generada: una sola definición, indexable y legible en triggers
+    existing = {row[1] for row in conn.execute('PRAGMA table_xinfo(forms)')}
+    if 'series' not in existing:
+        conn.execute(f'ALTER TABLE forms ADD COLUMN series TEXT GENERATED ALWAYS AS ({SERIES_SQL}) VIRTUAL')
+    conn.execute('DROP INDEX IF EXISTS idx_forms_series')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_forms_series ON forms(status, series)')
+
+    # Estadísticas materializadas: cantidad y bytes por (estado, serie),
+    # mantenidas por triggers con cada escritura en forms (forms_stats.py)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS forms_stats (
+            status TEXT NOT NULL,
+            series TEXT NOT NULL,
+            forms INTEGER NOT NULL,
+            bytes INTEGER NOT NULL,
+            PRIMARY KEY (status, series)
+        ) WITHOUT ROWID
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS forms_stats_insert AFTER INSERT ON forms
+        BEGIN {_stats_delta('NEW', 1)} END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS forms_stats_delete AFTER DELETE ON forms
+        BEGIN {_stats_delta('OLD', -1)} END
+    ''')
+    conn.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS forms_stats_update AFTER UPDATE OF status, file_size, form_number ON forms
+        BEGIN {_stats_delta('OLD', -1)} {_stats_delta('NEW', 1)} END
+    ''')
+    conn.execute('DELETE FROM forms_stats')
+    conn.execute('''
+        INSERT INTO forms_stats (status, series, forms, bytes)
+        SELECT COALESCE(status, 'pending'), series, COUNT(*), COALESCE(SUM(file_size), 0)
+        FROM forms
+        GROUP BY 1, 2
+    ''')
+
+
+def _migration_file_hashes(conn):
+    # SHA-256 de cada PDF según su (tamaño, mtime): consistency.py solo vuelve a leer los que cambian
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS file_hashes (
+            filename TEXT PRIMARY KEY,
+            size INTEGER NOT NULL,
+            mtime_ns INTEGER NOT NULL,
+            sha256 TEXT NOT NULL,
+            hashed_at TEXT
+        ) WITHOUT ROWID
+    ''')
+
+
+def _migration_download_events(conn):
+    # Un evento por petición de descarga (download_metrics.py); tiempos en ms
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS download_events (
+            id INTEGER PRIMARY KEY,
+            run_id TEXT NOT NULL,
+            ts TEXT NOT NULL,
+            source TEXT,
+            form_number TEXT,
+            url TEXT,
+            pattern TEXT,
+            status INTEGER,
+            bytes INTEGER,
+            dns_ms REAL,
+            connect_ms REAL,
+            tls_ms REAL,
+            ttfb_ms REAL,
+            transfer_ms REAL,
+            total_ms REAL,
+            retries INTEGER,
+            error TEXT
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_download_events_run ON download_events(run_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_download_events_form ON download_events(form_number, ts)')
+
+
+def _migration_editions_version(conn):
+    # /api/changes y /api/forms/<n>/editions se cachean por versión: form_editions también la cambia
+    for event in ('INSERT', 'UPDATE', 'DELETE'):
+        conn.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS form_editions_version_{event.lower()} AFTER {event} ON form_editions
+            BEGIN
+                UPDATE catalog_version SET version = version + 1 WHERE id = 1;
+            END
+        ''')
+
+
+# Cada migración se aplica una sola vez; el número de versión es su posición
+MIGRATIONS = [
+    _migration_base_tables,
+    _migration_sync_columns,
+    _migration_resolver_tables,
+    _migration_indexes,
+    _migration_search_index,
+    _migration_catalog_version,
+    _migration_content_store,
+    _migration_editions,
+    _migration_pdf_metadata,
+    _migration_form_fields,
+    _migration_stats,
+    _migration_file_hashes,
+    _migration_download_events,
+    _migration_editions_version,
+]
+
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def schema_version(conn):
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """Aplicar las migraciones pendientes, cada una en su propia transacción"""
+    version = schema_version(conn)
+    for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+        # BEGIN explícito: sqlite3 no abre transacciones para DDL por sí solo
+        conn.execute('BEGIN')
+        try:
+            migration(conn)
+            conn.execute(f'PRAGMA user_version = {number}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return schema_version(conn)
+
+
+# ---------------------------------------------------------------------------
+# Consultas compartidas
+# ---------------------------------------------------------------------------
+
+def catalog_version(conn):
+    """Versión del catálogo: cambia cada vez que un descargador escribe en forms"""
+    return conn.execute('SELECT version FROM catalog_version WHERE id = 1').fetchone()[0]
+
+
+def downloaded_forms(conn, query=None):
+    """(form_number, form_title, pdf_filename, file_size) de los formularios descargados"""
+    sql = '''
+        SELECT form_number, form_title, pdf_filename, file_size
+        FROM forms
+        WHERE status='downloaded'
+    '''
+    params = ()
+    if query:
+        sql += ' AND (form_number LIKE ? OR form_title LIKE ?)'
+        params = (f'%{query}%', f'%{query}%')
+    return conn.execute(sql + ' ORDER BY form_number', params).fetchall()
+
+
+def iter_downloaded_forms(conn, after=None, series=None, limit=None):
+    """
+    Cursor sobre los formularios descargados ordenados por número, desde
+    'after' (paginación por clave, usa idx_forms_status_number)
+    """
+    sql = '''
+        SELECT form_number, form_title, pdf_filename, file_size
+        FROM forms
+        WHERE status='downloaded'
+    '''
+    params = []
+    if after:
+        sql += ' AND form_number > ?'
+        params.append(after)
+    if series:
+        sql += ' AND series = ?'
+        params.append(series)
+    sql += ' ORDER BY form_number'
+    if limit:
+        sql += ' LIMIT ?'
+        params.append(limit)
+    return conn.execute(sql, params)
+
+
+def downloaded_filenames(conn):
+    """{nombre de archivo: sha256} de los PDF que el servidor puede entregar"""
+    return dict(conn.execute(
+        "SELECT pdf_filename, sha256 FROM forms WHERE status='downloaded' AND pdf_filename IS NOT NULL"))
+
+
+def largest_forms(conn, limit=10):
+    return conn.execute('''
+        SELECT form_number, form_title, file_size
+        FROM forms
+        WHERE status='downloaded'
+        ORDER BY file_size DESC
+        LIMIT ?
+    ''', (limit,)).fetchall()
+
+
+def iso_timestamp(value):
+    """
+    Fecha u hora ISO ('20250101', '2025-01-01T00:00Z'...) como el texto de
+    first_seen (hora local sin zona), para compararla como cadena. ValueError si no es ISO.
+    """
+    moment = datetime.fromisoformat(value)
+    if moment.tzinfo is not None:
+        moment = moment.astimezone().replace(tzinfo=None)
+    return moment.isoformat()
+
+
+def changes_since(conn, since, limit=None):
+    """
+    Ediciones vistas por primera vez después de 'since' (ISO), las más recientes primero:
+    (form_number, edition_date, sha256, file_size, first_seen, previous_edition_date, previous_sha256).
+    previous_sha256 es None si el formulario es nuevo.
+    """
+    return conn.execute('''
+        SELECT e.form_number, e.edition_date, e.sha256, e.file_size, e.first_seen,
+               p.edition_date, p.sha256
+        FROM form_editions e
+        LEFT JOIN form_editions p ON p.rowid = (
+            SELECT rowid FROM form_editions
+            WHERE form_number = e.form_number AND first_seen < e.first_seen
+            ORDER BY first_seen DESC
+            LIMIT 1
+        )
+        WHERE e.first_seen > ?
+        ORDER BY e.first_seen DESC
+        LIMIT ?
+    ''', (since, -1 if limit is None else limit)).fetchall()
+
+
+def edition_history(conn, form_number):
+    """(sha256, edition_date, file_size, first_seen, last_seen) de un formulario, la más reciente primero"""
+    return conn.execute('''
+        SELECT sha256, edition_date, file_size, first_seen, last_seen
+        FROM form_editions
+        WHERE form_number = ?
+        ORDER BY first_seen DESC
+    ''', (form_number,)).fetchall()
+
+
+FIELD_COLUMNS = ('form_number, name, short_name, field_type, page, tooltip, '
+                 'max_length, readonly, options')
+
+
+def form_field_schema(conn, form_number, name=None):
+    """Campos de un formulario en orden de página; name filtra por nombre corto o completo"""
+    sql = f'SELECT {FIELD_COLUMNS} FROM form_fields WHERE form_number = ?'
+    params = [form_number]
+    if name:
+        sql += ' AND (short_name = ? OR name = ?)'
+        params += [name, name]
+    return conn.execute(sql + ' ORDER BY page, name', params).fetchall()
+
+
+def find_fields(conn, short_name):
+    """Formularios que tienen un campo con ese nombre corto (usa idx_form_fields_short)"""
+    return conn.execute(f'''
+        SELECT {FIELD_COLUMNS} FROM form_fields
+        WHERE short_name = ?
+        ORDER BY form_number, name
+    ''', (short_name,)).fetchall()
+
+
+# ---------------------------------------------------------------------------
+# Escritura desde los descargadores
+# ---------------------------------------------------------------------------
+
+class FormsStore:
+    """
+    Una conexión por ejecución; las filas de forms se escriben por lotes
+    con executemany dentro de una sola transacción
+    """
+
+    def __init__(self, db_path=DB_PATH, batch_size=50):
+        self.conn = open_db(db_path)
+        self.batch_size = batch_size
+        self.pending = []
+        self.pending_objects = []
+        self.pending_editions = []
+
+    def save_form(self, **fields):
+        """Encolar una fila de forms (al hacer flush se actualizan solo las columnas dadas)"""
+        self.pending.append(fields)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def save_object(self, sha256, size):
+        """Registrar un objeto de pdf_store (se escribe con el próximo lote)"""
+        self.pending_objects.append((sha256, size, datetime.now().isoformat()))
+
+    def save_edition(self, form_number, sha256, size, edition_date=None):
+        """Registrar que se vio este contenido del formulario (nueva edición o last_seen)"""
+        now = datetime.now().isoformat()
+        self.pending_editions.append((form_number, sha256, size, edition_date, now, now))
+
+    def flush(self):
+        if not self.pending and not self.pending_objects and not self.pending_editions:
+            return
+        # Agrupar por columnas: cada grupo es un solo executemany
+        groups = {}
+        for row in self.pending:
+            groups.setdefault(tuple(row), []).append(tuple(row.values()))
+        try:
+            with self.conn:
+                self.conn.executemany(
+                    'INSERT OR IGNORE INTO pdf_objects (sha256, size, stored_at) VALUES (?, ?, ?)',
+                    self.pending_objects)
+                self.conn.executemany('''
+                    INSERT INTO form_editions (form_number, sha256, file_size, edition_date, first_seen, last_seen)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(form_number, sha256) DO UPDATE SET
+                        last_seen = excluded.last_seen,
+                        edition_date = COALESCE(excluded.edition_date, edition_date)
+                ''', self.pending_editions)
+                for columns, rows in groups.items():
+                    # Upsert: las columnas que el llamador no pasa (título, categoría...) se conservan
+                    placeholders = ', '.join('?' * len(columns))
+                    updates = ', '.join(f'{column} = excluded.{column}' for column in columns if column != 'form_number')
+                    self.conn.executemany(f'''
+                        INSERT INTO forms ({", ".join(columns)}) VALUES ({placeholders})
+                        ON CONFLICT(form_number) DO UPDATE SET {updates}
+                    ''', rows)
+        except sqlite3.Error as e:
+            print(f"  ✗ Error guardando en BD ({len(self.pending)} filas): {e}")
+        self.pending = []
+        self.pending_objects = []
+        self.pending_editions = []
+
+    def log_scrape(self, total_forms, downloaded, failed, status='completed'):
+        self.flush()
+        with self.conn:
+            self.conn.execute('''
+                INSERT INTO scrape_log (scrape_date, total_forms, downloaded, failed, status)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (datetime.now().isoformat(), total_forms, downloaded, failed, status))
+
+    def close(self):
+        self.flush()
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_sync_state(conn):
+    """Estado de sincronización por formulario: URL, archivo y validadores guardados"""
+    rows = conn.execute('''
+        SELECT form_number, pdf_url, pdf_filename, file_size, status,
+               etag, last_modified, content_length, sha256, edition_date
+        FROM forms
+    ''')
+    state = {}
+    for number, url, filename, size, status, etag, last_modified, length, sha256, edition in rows:
+        state[number] = {
+            'pdf_url': url,
+            'pdf_filename': filename,
+            'file_size': size,
+            'status': status,
+            'etag': etag,
+            'last_modified': last_modified,
+            'content_length': length,
+            'sha256': sha256,
+            'edition_date': edition,
+        }
+    return state
+
+
+def load_resolver(conn):
+    """Entradas de la caché de URL por formulario"""
+    rows = conn.execute('SELECT form_number, url, pattern, found, checked_at, expires_at FROM url_resolver')
+    return {
+        number: {'url': url, 'pattern': pattern, 'found': bool(found),
+                 'checked_at': checked_at, 'expires_at': expires_at}
+        for number, url, pattern, found, checked_at, expires_at in rows
+    }
+
+
+def load_pattern_stats(conn):
+    """Aciertos y fallos acumulados por patrón de URL"""
+    return {pattern: (hits, misses)
+            for pattern, hits, misses in conn.execute('SELECT pattern, hits, misses FROM url_pattern_stats')}
+
+
+def save_resolver(conn, entries, pattern_deltas):
+    """Guardar entradas de la caché y sumar los contadores por patrón"""
+    conn.executemany('''
+        INSERT OR REPLACE INTO url_resolver (form_number, url, pattern, found, checked_at, expires_at)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(number, e['url'], e['pattern'], int(e['found']), e['checked_at'], e['expires_at'])
+          for number, e in entries.items()])
+    conn.executemany('''
+        INSERT INTO url_pattern_stats (pattern, hits, misses) VALUES (?, ?, ?)
+        ON CONFLICT(pattern) DO UPDATE SET hits = hits + excluded.hits, misses = misses + excluded.misses
+    ''', [(pattern, hits, misses) for pattern, (hits, misses) in pattern_deltas.items()])
+    conn.commit()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Estadísticas del catálogo en una sola lectura
+forms_stats guarda cantidad y bytes por (estado, serie) y los triggers de
+forms la mantienen al día con cada escritura de los descargadores: leer todas
+las estadísticas recorre unas decenas de filas, sin importar cuántos
+formularios haya. compute() calcula lo mismo en una sola pasada sobre forms
+para verificar o reconstruir la tabla.
+"""
+
+import os
+
+import forms_db
+
+
+def summarize(rows):
+    """
+    Filas (status, series, forms, bytes) -> {'total', 'status', 'downloaded',
+    'downloaded_bytes', 'bytes', 'series'}. 'series' cuenta solo los descargados.
+    """
+    stats = {'total': 0, 'status': {}, 'downloaded': 0, 'downloaded_bytes': 0, 'bytes': 0, 'series': {}}
+    for status, series, forms, size in rows:
+        if not forms:
+            continue
+        stats['total'] += forms
+        stats['bytes'] += size
+        stats['status'][status] = stats['status'].get(status, 0) + forms
+        if status == 'downloaded':
+            stats['downloaded'] += forms
+            stats['downloaded_bytes'] += size
+            stats['series'][series] = stats['series'].get(series, 0) + forms
+    return stats
+
+
+def read(conn):
+    """Estadísticas materializadas (lectura de forms_stats)"""
+    return summarize(conn.execute('SELECT status, series, forms, bytes FROM forms_stats'))
+
+
+def compute(conn):
+    """Las mismas estadísticas calculadas sobre forms (una pasada, GROUP BY estado y serie)"""
+    return summarize(conn.execute('''
+        SELECT COALESCE(status, 'pending'), series, COUNT(*), COALESCE(SUM(file_size), 0)
+        FROM forms
+        GROUP BY 1, 2
+    '''))
+
+
+def rebuild(conn):
+    """Recalcular forms_stats (p. ej. tras editar forms con triggers recursivos desactivados)"""
+    with conn:
+        conn.execute('DELETE FROM forms_stats')
+        conn.execute('''
+            INSERT INTO forms_stats (status, series, forms, bytes)
+            SELECT COALESCE(status, 'pending'), series, COUNT(*), COALESCE(SUM(file_size), 0)
+            FROM forms
+            GROUP BY 1, 2
+        ''')
+
+
+def count_pdfs(pdfs_dir):
+    """Cantidad de PDF en el directorio (un solo recorrido con scandir)"""
+    try:
+        with os.scandir(pdfs_dir) as entries:
+            return sum(1 for entry in entries if entry.name.endswith('.pdf'))
+    except FileNotFoundError:
+        return 0
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Estadísticas del catálogo de formularios')
+    parser.add_argument('--verify', action='store_true', help='comparar forms_stats con un recálculo sobre forms')
+    parser.add_argument('--rebuild', action='store_true', help='recalcular forms_stats')
+    args = parser.parse_args()
+
+    conn = forms_db.open_db(forms_db.DB_PATH)
+    if args.rebuild:
+        rebuild(conn)
+        print("forms_stats recalculada")
+
+    stats = read(conn)
+    print(f"Total: {stats['total']}")
+    for status, count in sorted(stats['status'].items()):
+        print(f"  {status}: {count}")
+    print(f"Descargados: {stats['downloaded']} ({stats['downloaded_bytes'] / (1024 * 1024):.2f} MB)")
+    print(f"Series: {', '.join(f'{k}={v}' for k, v in sorted(stats['series'].items()))}")
+
+    if args.verify:
+        if compute(conn) == stats:
+            print("✓ forms_stats coincide con forms")
+        else:
+            print("✗ forms_stats no coincide con forms (ejecuta --rebuild)")
+            conn.close()
+            raise SystemExit(1)
+    conn.close()
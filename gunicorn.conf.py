@@ -0,0 +1,36 @@
+"""
+Configuración de gunicorn para server.py en Linux/macOS (varios procesos)
+
+    gunicorn -c gunicorn.conf.py server:app
+
+USCIS_WORKERS, USCIS_THREADS y USCIS_BIND ajustan la concurrencia.
+"""
+import multiprocessing
+import os
+
+# Las rutas de la BD y los PDF son relativas al proyecto
+chdir = os.path.dirname(os.path.abspath(__file__))
+
+bind = os.environ.get('USCIS_BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('USCIS_WORKERS', multiprocessing.cpu_count()))
+threads = int(os.environ.get('USCIS_THREADS', 8))
+worker_class = 'gthread'
+
+# SIGTERM: los workers terminan las peticiones en curso antes de salir
+graceful_timeout = 30
+timeout = 60
+
+# Los workers solo leen la base de datos
+raw_env = ['USCIS_DB_READONLY=1']
+
+
+def on_starting(arbiter):
+    # Migraciones una sola vez en el proceso maestro, antes de crear workers
+    import forms_db
+    os.chdir(chdir)
+    forms_db.open_db(forms_db.DB_PATH).close()
+
+
+def worker_exit(arbiter, worker):
+    from server import close_pool
+    close_pool()
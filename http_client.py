@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+"""
+Cliente HTTP compartido para los descargadores de formularios USCIS
+Una sola Session con keep-alive, pool de conexiones, reintentos y timeouts.
+trace() mide DNS, conexión, TLS, espera y transferencia de las peticiones del hilo.
+"""
+
+import hashlib
+import json
+import os
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import formatdate
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError, NameResolutionError, NewConnectionError
+from urllib3.util import connection as urllib3_connection
+from urllib3.util.retry import Retry
+
+DEFAULT_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Accept': 'application/json, text/html, application/pdf, */*',
+    'Accept-Language': 'es-ES,es;q=0.9,en;q=0.8',
+}
+
+DEFAULT_TIMEOUT = (5, 30)  # (conexión, lectura) en segundos
+
+
+class PooledSession(requests.Session):
+    """Session que aplica un timeout por defecto a cada petición"""
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+# ---------------------------------------------------------------------------
+# Trazas por hilo
+# ---------------------------------------------------------------------------
+
+_trace = threading.local()
+
+TRACE_FIELDS = ('dns_ms', 'connect_ms', 'tls_ms', 'ttfb_ms', 'transfer_ms')
+
+
+@contextmanager
+def trace():
+    """
+    Tiempos (ms) de las peticiones que haga este hilo dentro del bloque:
+    dns, connect (TCP), tls, ttfb (espera de la respuesta ya conectado),
+    transfer (cuerpo), además de retries y conexiones nuevas
+    """
+    timing = dict.fromkeys(TRACE_FIELDS, 0.0)
+    timing.update(retries=0, connections=0)
+    previous = getattr(_trace, 'current', None)
+    _trace.current = timing
+    try:
+        yield timing
+    finally:
+        _trace.current = previous
+
+
+def _note(key, value):
+    timing = getattr(_trace, 'current', None)
+    if timing is not None:
+        timing[key] += value
+
+
+def _setup_ms():
+    timing = getattr(_trace, 'current', None)
+    return timing['dns_ms'] + timing['connect_ms'] + timing['tls_ms'] if timing else 0.0
+
+
+class _TracedConnection:
+    """Conexión de urllib3 que separa la resolución DNS, el connect TCP y el TLS"""
+
+    def _new_conn(self):
+        if getattr(_trace, 'current', None) is None:
+            return super()._new_conn()
+        # Lo mismo que urllib3 (create_connection), con la resolución cronometrada aparte
+        start = time.perf_counter()
+        try:
+            infos = socket.getaddrinfo(self._dns_host.strip('[]'), self.port,
+                                       urllib3_connection.allowed_gai_family(), socket.SOCK_STREAM)
+        except socket.gaierror as e:
+            raise NameResolutionError(self.host, self, e) from e
+        resolved = time.perf_counter()
+        _note('dns_ms', (resolved - start) * 1000)
+        error = OSError('getaddrinfo returns an empty list')
+        for address in dict.fromkeys(info[4][0] for info in infos):
+            try:
+                sock = urllib3_connection.create_connection(
+                    (address, self.port), self.timeout,
+                    source_address=self.source_address, socket_options=self.socket_options)
+            except OSError as e:
+                error = e
+                continue
+            _note('connect_ms', (time.perf_counter() - resolved) * 1000)
+            _note('connections', 1)
+            return sock
+        # Se probaron todas las direcciones: el último error, sin volver a conectar
+        if isinstance(error, socket.timeout):
+            raise ConnectTimeoutError(
+                self, f'Connection to {self.host} timed out. (connect timeout={self.timeout})') from error
+        raise NewConnectionError(self, f'Failed to establish a new connection: {error}') from error
+
+    def connect(self):
+        start = time.perf_counter()
+        setup = _setup_ms()
+        super().connect()
+        # Lo que no fue DNS ni connect es el handshake TLS (0 en http://)
+        _note('tls_ms', max(0.0, (time.perf_counter() - start) * 1000 - (_setup_ms() - setup)))
+
+
+class TracedHTTPConnection(_TracedConnection, HTTPConnection):
+    pass
+
+
+class TracedHTTPSConnection(_TracedConnection, HTTPSConnection):
+    pass
+
+
+class TracedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TracedHTTPConnection
+
+
+class TracedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TracedHTTPSConnection
+
+
+class TracingAdapter(HTTPAdapter):
+    """HTTPAdapter cuyas conexiones reportan sus tiempos a trace()"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': TracedHTTPConnectionPool,
+            'https': TracedHTTPSConnectionPool,
+        }
+
+
+def create_session(pool_size=16, retries=3, backoff=0.5, timeout=DEFAULT_TIMEOUT, headers=None):
+    """Crear una Session con pool de conexiones y política de reintentos"""
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = TracingAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry)
+
+    session = PooledSession(timeout=timeout)
+    session.headers.update(DEFAULT_HEADERS)
+    if headers:
+        session.headers.update(headers)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+_shared_session = None
+_shared_lock = threading.Lock()
+
+
+def get_session():
+    """Session compartida por todo el proceso (se crea la primera vez)"""
+    global _shared_session
+    with _shared_lock:
+        if _shared_session is None:
+            _shared_session = create_session()
+        return _shared_session
+
+
+def conditional_headers(etag=None, last_modified=None, filepath=None):
+    """Cabeceras If-None-Match / If-Modified-Since para una descarga condicional"""
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if last_modified:
+        headers['If-Modified-Since'] = last_modified
+    elif filepath and os.path.exists(filepath):
+        # Sin validadores guardados: usar la fecha del archivo local
+        headers['If-Modified-Since'] = formatdate(os.path.getmtime(filepath), usegmt=True)
+    return headers
+
+
+def response_validators(response):
+    """Extraer ETag, Last-Modified y Content-Length de una respuesta"""
+    length = response.headers.get('Content-Length')
+    return {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+        'content_length': int(length) if length and length.isdigit() else None,
+    }
+
+
+class IncompleteDownload(Exception):
+    """La transferencia terminó antes de recibir todos los bytes"""
+
+
+def _read_part_meta(meta_path):
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _remove(*paths):
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def download_file(session, url, filepath, headers=None, timeout=None, chunk_size=64 * 1024):
+    """
+    Descargar url a filepath de forma atómica y reanudable.
+
+    Los bytes se escriben en filepath + '.part' y solo se renombra al final,
+    tras verificar la longitud. Si quedó un .part de un intento anterior se
+    pide el resto con Range/If-Range. Devuelve (status, size, validators);
+    status es 200 al completar, 304 si no hubo cambios, o el código de error.
+    Al completar, validators incluye el SHA-256 del archivo.
+    """
+    part_path = filepath + '.part'
+    meta_path = part_path + '.json'
+    headers = dict(headers or {})
+    # Sin compresión: Content-Length y Range se refieren a los bytes del PDF
+    headers.setdefault('Accept-Encoding', 'identity')
+
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    meta = _read_part_meta(meta_path) if offset else {}
+    etag = meta.get('etag')
+    if etag and etag.startswith('W/'):
+        etag = None  # If-Range requiere un validador fuerte
+    if offset and (etag or meta.get('last_modified')):
+        headers['Range'] = f'bytes={offset}-'
+        headers['If-Range'] = etag or meta['last_modified']
+    else:
+        offset = 0
+
+    kwargs = {'timeout': timeout} if timeout else {}
+    start = time.perf_counter()
+    setup = _setup_ms()
+    with session.get(url, stream=True, headers=headers, **kwargs) as response:
+        # Espera hasta las cabeceras, sin DNS/conexión/TLS (incluye reintentos)
+        _note('ttfb_ms', (time.perf_counter() - start) * 1000 - (_setup_ms() - setup))
+        retries = getattr(response.raw, 'retries', None)
+        _note('retries', len(retries.history) if retries else 0)
+        if response.status_code == 304:
+            return 304, None, response_validators(response)
+
+        validators = response_validators(response)
+        if response.status_code == 206 and offset:
+            # Content-Range: bytes <inicio>-<fin>/<total>
+            content_range = response.headers.get('Content-Range', '')
+            start, _, total = content_range.replace('bytes ', '').partition('/')
+            if not start.startswith(f'{offset}-'):
+                _remove(part_path, meta_path)
+                raise IncompleteDownload(f'Content-Range inesperado: {content_range}')
+            validators['content_length'] = int(total) if total.isdigit() else None
+            mode = 'ab'
+        elif response.status_code == 200:
+            mode = 'wb'
+        elif response.status_code == 416:
+            # El .part no corresponde al archivo remoto: empezar de cero
+            _remove(part_path, meta_path)
+            return download_file(session, url, filepath, headers={
+                k: v for k, v in headers.items() if k not in ('Range', 'If-Range')
+            }, timeout=timeout, chunk_size=chunk_size)
+        else:
+            return response.status_code, 0, {}
+
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(validators, f)
+
+        # SHA-256 calculado mientras se escribe (al reanudar, primero lo ya bajado)
+        digest = hashlib.sha256()
+        if mode == 'ab':
+            with open(part_path, 'rb') as f:
+                for chunk in iter(lambda: f.read(chunk_size), b''):
+                    digest.update(chunk)
+
+        transfer_start = time.perf_counter()
+        with open(part_path, mode) as f:
+            for chunk in response.iter_content(chunk_size):
+                digest.update(chunk)
+                f.write(chunk)
+        _note('transfer_ms', (time.perf_counter() - transfer_start) * 1000)
+
+    size = os.path.getsize(part_path)
+    expected = validators['content_length']
+    if expected is not None and size != expected:
+        if size > expected:
+            _remove(part_path, meta_path)
+        raise IncompleteDownload(f'{url}: {size} de {expected} bytes')
+
+    os.replace(part_path, filepath)
+    _remove(meta_path)
+    validators['content_length'] = size
+    validators['sha256'] = digest.hexdigest()
+    return 200, size, validators
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+"""
+Extracción de texto y metadatos de los PDF descargados
+Título, número de páginas, fecha de edición, idioma y campos AcroForm van a
+pdf_metadata; el texto va al índice de búsqueda. Los PDF se leen en paralelo
+en un pool de procesos y solo se vuelven a leer los que cambiaron de hash.
+"""
+
+import json
+import logging
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import form_fields
+import forms_db
+import search_index
+from editions import parse_edition_date
+from pdf_store import hash_file
+
+try:
+    from pypdf import PdfReader
+except ImportError:  # sin pypdf solo se indexan los metadatos de la BD
+    PdfReader = None
+
+# pypdf avisa de cada PDF cifrado; no aporta nada a la extracción
+logging.getLogger('pypdf').setLevel(logging.ERROR)
+
+PDFS_PATH = 'uscis_forms/pdfs'
+
+# Texto máximo por PDF: las instrucciones largas no mejoran la búsqueda
+MAX_BODY_CHARS = 200_000
+# Resultados por transacción al escribir en la BD
+WRITE_BATCH = 20
+
+# Palabras frecuentes para distinguir formularios en español de los en inglés
+SPANISH_WORDS = frozenset('de la el que los las para por del con una su usted formulario'.split())
+ENGLISH_WORDS = frozenset('the of and to you for your this or is if form with'.split())
+
+
+def detect_language(text):
+    """'es' o 'en' según las palabras frecuentes del texto; None si no hay texto"""
+    words = re.findall(r'[a-záéíóúñ]+', text[:20_000].lower())
+    spanish = sum(word in SPANISH_WORDS for word in words)
+    english = sum(word in ENGLISH_WORDS for word in words)
+    if not spanish and not english:
+        return None
+    return 'es' if spanish > english else 'en'
+
+
+def clean_title(title, form_number):
+    """'Form I-130, Petition for Alien Relative' -> 'Petition for Alien Relative'"""
+    title = ' '.join((title or '').split())
+    prefix = re.compile(rf'^(Form\s+)?{re.escape(form_number)}(\s*[,:\-–]\s*|\s*$)', re.IGNORECASE)
+    return prefix.sub('', title) or None
+
+
+def read_pdf(path, form_number):
+    """Título, páginas, edición, idioma, campos y texto de un PDF (vacíos si no se puede leer)"""
+    info = {'title': None, 'pages': None, 'edition_date': None, 'language': None, 'fields': [], 'body': ''}
+    if PdfReader is None:
+        return info
+    try:
+        reader = PdfReader(path)
+        chunks = []
+        size = 0
+        for page in reader.pages:
+            text = page.extract_text() or ''
+            chunks.append(text)
+            size += len(text)
+            if size >= MAX_BODY_CHARS:
+                break
+        body = ' '.join(chunks)[:MAX_BODY_CHARS]
+        # El pie con "Edition MM/DD/YY" está en la primera página (o en la última leída)
+        edition = parse_edition_date(chunks[0]) if chunks else None
+        if not edition and len(chunks) > 1:
+            edition = parse_edition_date(chunks[-1])
+        info.update(
+            title=clean_title(reader.metadata.title if reader.metadata else None, form_number),
+            pages=len(reader.pages),
+            edition_date=edition,
+            language=detect_language(body),
+            fields=form_fields.read_fields(reader),
+            body=body,
+        )
+    except Exception as e:
+        print(f"  ✗ No se pudo leer {os.path.basename(path)}: {e}")
+    return info
+
+
+def extract_job(job):
+    """
+    Trabajo de un proceso del pool: (form_number, ruta, sha256, sha256 ya extraído).
+    Devuelve (form_number, sha256, mtime, tamaño, info); info es None si el
+    contenido no cambió desde la última extracción.
+    """
+    number, path, digest, previous = job
+    # Filas anteriores al almacén por contenido: el hash se calcula aquí
+    digest = digest or hash_file(path)
+    stat = os.stat(path)
+    if digest == previous:
+        return number, digest, stat.st_mtime, stat.st_size, None
+    return number, digest, stat.st_mtime, stat.st_size, read_pdf(path, number)
+
+
+def pending_jobs(conn, pdfs_dir=PDFS_PATH, force=False):
+    """Trabajos para los PDF cuyo hash no coincide con el de la última extracción"""
+    rows = conn.execute('''
+        SELECT f.form_number, f.pdf_filename, f.sha256, m.sha256
+        FROM forms f
+        LEFT JOIN pdf_metadata m ON m.form_number = f.form_number
+        WHERE f.status='downloaded'
+    ''').fetchall()
+    jobs = []
+    for number, filename, digest, extracted in rows:
+        if not force and digest and digest == extracted:
+            continue
+        path = os.path.join(pdfs_dir, filename or f'{number}.pdf')
+        if os.path.exists(path):
+            jobs.append((number, path, digest, None if force else extracted))
+    return jobs
+
+
+def save_results(conn, results):
+    """Escribir un lote de resultados en una transacción; devuelve cuántos se extrajeron"""
+    saved = 0
+    now = datetime.now().isoformat()
+    with conn:
+        for number, digest, mtime, size, info in results:
+            if info is None:
+                continue
+            conn.execute('''
+                INSERT OR REPLACE INTO pdf_metadata
+                    (form_number, sha256, title, page_count, edition_date, language,
+                     field_count, field_names, extracted_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (number, digest, info['title'], info['pages'], info['edition_date'], info['language'],
+                  len(info['fields']), json.dumps([f['name'] for f in info['fields']]), now))
+            form_fields.save_fields(conn, number, info['fields'])
+            # Solo se completan los datos que los descargadores no trajeron
+            conn.execute('''
+                UPDATE forms SET
+                    form_title = COALESCE(NULLIF(form_title, ''), ?),
+                    edition_date = COALESCE(NULLIF(edition_date, ''), ?)
+                WHERE form_number = ?
+                  AND (COALESCE(form_title, '') = '' OR COALESCE(edition_date, '') = '')
+            ''', (info['title'], info['edition_date'], number))
+            conn.execute('''
+                UPDATE form_editions SET edition_date = ?
+                WHERE form_number = ? AND sha256 = ? AND edition_date IS NULL
+            ''', (info['edition_date'], number, digest))
+            title = conn.execute('SELECT form_title FROM forms WHERE form_number = ?', (number,)).fetchone()[0]
+            search_index.index_form(conn, number, title, info['body'], mtime, size)
+            saved += 1
+    return saved
+
+
+def update(conn, pdfs_dir=PDFS_PATH, force=False, workers=None):
+    """
+    Extraer los PDF nuevos o cambiados y actualizar pdf_metadata y el índice.
+    workers=None usa un proceso por núcleo. Devuelve (extraídos, eliminados del índice).
+    """
+    jobs = pending_jobs(conn, pdfs_dir, force)
+    workers = workers or os.cpu_count() or 1
+
+    extracted = 0
+    batch = []
+    if workers == 1 or len(jobs) <= 1:
+        # No vale la pena arrancar procesos
+        results = map(extract_job, jobs)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        chunksize = max(1, len(jobs) // (workers * 4))
+        results = executor.map(extract_job, jobs, chunksize=chunksize)
+    try:
+        for result in results:
+            batch.append(result)
+            if len(batch) >= WRITE_BATCH:
+                extracted += save_results(conn, batch)
+                batch = []
+        extracted += save_results(conn, batch)
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    removed = search_index.remove_stale(conn)
+    with conn:
+        conn.execute('''
+            DELETE FROM pdf_metadata
+            WHERE form_number NOT IN (SELECT form_number FROM forms WHERE status='downloaded')
+        ''')
+        conn.execute('''
+            DELETE FROM form_fields
+            WHERE form_number NOT IN (SELECT form_number FROM forms WHERE status='downloaded')
+        ''')
+        if extracted or removed:
+            # Invalida las respuestas cacheadas por el servidor
+            conn.execute('UPDATE catalog_version SET version = version + 1 WHERE id = 1')
+    return extracted, removed
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Extraer texto y metadatos de los PDF de USCIS')
+    parser.add_argument('--force', action='store_true', help='volver a leer todos los PDF')
+    parser.add_argument('--workers', type=int, default=None, help='procesos (por defecto, uno por núcleo)')
+    args = parser.parse_args()
+
+    if PdfReader is None:
+        print("⚠ pypdf no está instalado: solo se indexarán números, títulos y palabras clave")
+
+    conn = forms_db.open_db(forms_db.DB_PATH)
+    start = time.perf_counter()
+    extracted, removed = update(conn, PDFS_PATH, force=args.force, workers=args.workers)
+    elapsed = time.perf_counter() - start
+    total = conn.execute('SELECT COUNT(*) FROM pdf_metadata').fetchone()[0]
+    conn.close()
+
+    print(f"Extraídos: {extracted}")
+    print(f"Eliminados del índice: {removed}")
+    print(f"Total con metadatos: {total}")
+    print(f"Tiempo: {elapsed:.1f} s")
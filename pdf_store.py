@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Almacén de PDF direccionado por contenido (SHA-256)
+
+Cada PDF se guarda una sola vez en uscis_forms/store/<ab>/<sha256>.pdf.
+uscis_forms/pdfs/<form>.pdf sigue existiendo como enlace duro al objeto
+(o simbólico / copia si el sistema de archivos no los admite), así que el
+servidor y los scripts existentes no cambian.
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+from datetime import datetime
+
+import forms_db
+
+STORE_DIR = 'uscis_forms/store'
+PDFS_PATH = 'uscis_forms/pdfs'
+
+
+def hash_file(path, chunk_size=1024 * 1024):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class PdfStore:
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = store_dir
+
+    def path_for(self, digest):
+        return os.path.join(self.store_dir, digest[:2], f'{digest}.pdf')
+
+    def has(self, digest):
+        return os.path.exists(self.path_for(digest))
+
+    def verify(self, digest):
+        """True si el objeto existe y su contenido coincide con el hash"""
+        path = self.path_for(digest)
+        return os.path.exists(path) and hash_file(path) == digest
+
+    def adopt(self, path, digest):
+        """
+        Guardar el archivo en el almacén (si el contenido es nuevo) y dejar
+        'path' apuntando al objeto. Si el contenido ya existía, el archivo
+        descargado se reemplaza por un enlace al objeto (deduplicación).
+        """
+        obj = self.path_for(digest)
+        if not os.path.exists(obj):
+            os.makedirs(os.path.dirname(obj), exist_ok=True)
+            # Nombre temporal único: dos hilos pueden traer el mismo contenido
+            tmp = f'{obj}.{os.getpid()}.{threading.get_ident()}.tmp'
+            try:
+                os.link(path, tmp)
+            except OSError:
+                shutil.copyfile(path, tmp)
+            os.replace(tmp, obj)
+        self.link(digest, path)
+        return obj
+
+    def link(self, digest, path):
+        """Reemplazar 'path' de forma atómica por un enlace al objeto"""
+        obj = self.path_for(digest)
+        if os.path.exists(path) and os.path.samefile(path, obj):
+            return
+        tmp = path + '.link'
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        try:
+            os.link(obj, tmp)
+        except OSError:
+            try:
+                os.symlink(os.path.relpath(obj, os.path.dirname(path) or '.'), tmp)
+            except OSError:
+                shutil.copyfile(obj, tmp)
+        os.replace(tmp, path)
+
+
+def migrate_legacy(conn, store, pdfs_dir=PDFS_PATH):
+    """Mover al almacén los PDF descargados antes de que existiera; devuelve (objetos, duplicados)"""
+    rows = conn.execute('''
+        SELECT form_number, pdf_filename, file_size
+        FROM forms
+        WHERE status='downloaded' AND sha256 IS NULL
+    ''').fetchall()
+    stored = set()
+    duplicates = 0
+    for number, filename, size in rows:
+        path = os.path.join(pdfs_dir, filename or f'{number}.pdf')
+        if not os.path.exists(path):
+            continue
+        digest = hash_file(path)
+        if store.has(digest):
+            duplicates += 1
+        store.adopt(path, digest)
+        stored.add(digest)
+        with conn:
+            conn.execute('UPDATE forms SET sha256 = ? WHERE form_number = ?', (digest, number))
+            conn.execute('INSERT OR IGNORE INTO pdf_objects (sha256, size, stored_at) VALUES (?, ?, ?)',
+                         (digest, os.path.getsize(path), datetime.now().isoformat()))
+    return len(stored), duplicates
+
+
+if __name__ == '__main__':
+    conn = forms_db.open_db(forms_db.DB_PATH)
+    objects, duplicates = migrate_legacy(conn, PdfStore(), PDFS_PATH)
+    conn.close()
+    print(f"Objetos en el almacén: {objects}")
+    print(f"Duplicados enlazados: {duplicates}")
@@ -5,10 +5,18 @@ Uses predictable URL patterns to download common forms directly
 """
 
 import os
-import sqlite3
-import requests
+import threading
 import time
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+
+from forms_db import FormsStore, load_pattern_stats, load_resolver, load_sync_state, save_resolver
+from http_client import conditional_headers, create_session, download_file
+import catalog_diff
+from download_metrics import LOG_NAME, DownloadMetrics, format_summary
+import pdf_extract
+from pdf_store import PdfStore
 
 # Lista exhaustiva de formularios USCIS conocidos
 COMMON_FORMS = [
@@ -35,14 +43,113 @@ COMMON_FORMS = [
     "EOIR-29", # EOIR form
 ]
 
+class HostRateLimiter:
+    """Limita las peticiones por host (presupuesto de cortesía compartido entre hilos)"""
+
+    def __init__(self, max_per_second):
+        self.interval = 1.0 / max_per_second if max_per_second > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_slot = {}
+
+    def wait(self, url):
+        if not self.interval:
+            return
+        host = urlparse(url).netloc
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot.get(host, now))
+            self.next_slot[host] = slot + self.interval
+        delay = slot - now
+        if delay > 0:
+            time.sleep(delay)
+
+
+class UrlResolver:
+    """Recuerda qué URL funcionó para cada formulario y ordena los patrones por aciertos"""
+
+    def __init__(self, patterns, negative_ttl=timedelta(days=7)):
+        self.patterns = list(patterns)
+        self.negative_ttl = negative_ttl
+        self.entries = {}
+        self.changed = {}
+        self.pattern_deltas = {}
+
+    def load(self, conn):
+        self.entries = load_resolver(conn)
+        stats = load_pattern_stats(conn)
+
+        def hit_rate(pattern):
+            hits, misses = stats.get(pattern, (0, 0))
+            return hits / (hits + misses) if hits + misses else 0.0
+
+        # sorted() es estable: sin estadísticas se respeta el orden original
+        self.patterns.sort(key=hit_rate, reverse=True)
+
+    def is_known_missing(self, form_number):
+        entry = self.entries.get(form_number)
+        return bool(entry and not entry['found'] and entry['expires_at'] > datetime.now().isoformat())
+
+    def candidates(self, form_number, preferred=None):
+        """Lista de (pattern, url) a probar, la URL conocida primero"""
+        form_lower = form_number.lower().replace(' ', '-')
+        candidates = [(p, p.format(form=form_lower)) for p in self.patterns]
+
+        entry = self.entries.get(form_number)
+        known_url = entry['url'] if entry and entry['found'] else preferred
+        if known_url:
+            known = [c for c in candidates if c[1] == known_url] or [(None, known_url)]
+            candidates = known + [c for c in candidates if c[1] != known_url]
+        return candidates
+
+    def record(self, form_number, result):
+        """Actualizar la caché con el resultado de un intento (solo desde el hilo principal)"""
+        if result.get('skipped'):
+            return
+        now = datetime.now()
+        found = result['status'] == 'downloaded'
+        # Un fallo de red no prueba que el formulario no exista: no se cachea
+        if found or not result.get('errors'):
+            self.entries[form_number] = self.changed[form_number] = {
+                'url': result['url'],
+                'pattern': result.get('pattern'),
+                'found': found,
+                'checked_at': now.isoformat(),
+                'expires_at': None if found else (now + self.negative_ttl).isoformat(),
+            }
+        for pattern, hit in result.get('tried', []):
+            if pattern is None:
+                continue
+            hits, misses = self.pattern_deltas.get(pattern, (0, 0))
+            self.pattern_deltas[pattern] = (hits + hit, misses + (not hit))
+
+    def save(self, conn):
+        save_resolver(conn, self.changed, self.pattern_deltas)
+        self.changed = {}
+        self.pattern_deltas = {}
+
+
 class QuickDownloader:
-    def __init__(self):
-        self.output_dir = 'uscis_forms'
+    def __init__(self, workers=8, max_per_second=10.0, session=None, incremental=True,
+                 negative_ttl_days=7, output_dir='uscis_forms', extract=True):
+        self.output_dir = output_dir
         self.pdfs_dir = os.path.join(self.output_dir, 'pdfs')
         self.db_path = os.path.join(self.output_dir, 'uscis_forms.db')
+        # Los PDF se guardan por SHA-256; pdfs/<form>.pdf es un enlace al objeto
+        self.pdf_store = PdfStore(os.path.join(self.output_dir, 'store'))
         
         os.makedirs(self.pdfs_dir, exist_ok=True)
         
+        # Concurrencia: hilos de descarga y peticiones por segundo por host
+        self.workers = max(1, workers)
+        self.rate_limiter = HostRateLimiter(max_per_second)
+        
+        # Una sola Session (keep-alive) con un pool del tamaño de los hilos
+        self.session = session or create_session(pool_size=self.workers)
+        
+        # Sincronización incremental: GET condicional con ETag/Last-Modified guardados
+        self.incremental = incremental
+        self.sync_state = {}
+        
         # Patrones de URL para intentar
         self.url_patterns = [
             "https://www.uscis.gov/sites/default/files/document/forms/{form}.pdf",
@@ -50,90 +157,212 @@ class QuickDownloader:
             "https://www.uscis.gov/sites/default/files/files/form/{form}.pdf",
         ]
         
+        # Caché persistente de URL resueltas (y de formularios inexistentes, con TTL)
+        self.resolver = UrlResolver(self.url_patterns, timedelta(days=negative_ttl_days))
+        
+        # Extraer metadatos, campos y texto de los PDF al terminar (pdf_extract)
+        self.extract = extract
+        
+        # Eventos en memoria para llamadas sueltas a try_download; run() los escribe en el log y la BD
+        self.metrics = DownloadMetrics('quick_download')
+        
     def init_db(self):
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('''CREATE TABLE IF NOT EXISTS forms (
-            id INTEGER PRIMARY KEY,
-            form_number TEXT UNIQUE,
-            form_title TEXT,
-            pdf_url TEXT,
-            pdf_filename TEXT,
-            file_size INTEGER,
-            download_date TEXT,
-            status TEXT
-        )''')
-        conn.commit()
-        conn.close()
+        # Una sola conexión para toda la ejecución; el esquema lo define forms_db
+        self.store = FormsStore(self.db_path)
+        # También con --full: la fecha de edición de un PDF sin cambios sale de aquí
+        self.sync_state = load_sync_state(self.store.conn)
+        self.resolver.load(self.store.conn)
         
     def try_download(self, form_number):
         """Try different URL patterns to download form"""
-        form_lower = form_number.lower().replace(' ', '-')
+        filepath = os.path.join(self.pdfs_dir, f"{form_number}.pdf")
+        
+        if self.resolver.is_known_missing(form_number):
+            # No existía la última vez y la entrada negativa aún no expira
+            return {'url': None, 'size': 0, 'status': 'not_found', 'changed': False, 'skipped': True,
+                    'etag': None, 'last_modified': None, 'content_length': None, 'sha256': None,
+                    'edition_date': None}
+        
+        # Si ya lo tenemos, preguntar primero a la URL conocida si cambió
+        known = self.sync_state.get(form_number)
+        known_url = None
+        if known and known['status'] == 'downloaded' and known['pdf_url'] and os.path.exists(filepath):
+            known_url = known['pdf_url']
         
-        for pattern in self.url_patterns:
-            url = pattern.format(form=form_lower)
+        tried = []
+        errors = False
+        for pattern, url in self.resolver.candidates(form_number, preferred=known_url):
+            headers = {}
+            if url == known_url and self.incremental:
+                headers = conditional_headers(known['etag'], known['last_modified'], filepath)
             
             try:
-                response = requests.get(url, timeout=15, stream=True)
-                if response.status_code == 200:
-                    # Success!
-                    filename = f"{form_number}.pdf"
-                    filepath = os.path.join(self.pdfs_dir, filename)
-                    
-                    with open(filepath, 'wb') as f:
-                        for chunk in response.iter_content(8192):
-                            f.write(chunk)
-                    
-                    size = os.path.getsize(filepath)
-                    print(f"✓ {form_number:15} - {size:10,} bytes - {url}")
-                    return url, size, 'downloaded'
-                    
+                self.rate_limiter.wait(url)
+                with self.metrics.request(form_number, url, pattern) as event:
+                    status, size, validators = download_file(
+                        self.session, url, filepath, headers=headers, timeout=15)
+                    event['status'], event['bytes'] = status, size
             except Exception as e:
-                continue
+                # Timeout o corte: el .part queda para reanudar en la próxima ejecución
+                errors = True
+                break
+            
+            if status == 304:
+                # Sin cambios: conservar archivo y validadores
+                tried.append((pattern, True))
+                return {
+                    'url': url,
+                    'pattern': pattern,
+                    'tried': tried,
+                    'size': os.path.getsize(filepath),
+                    'status': 'downloaded',
+                    'changed': False,
+                    'etag': validators['etag'] or known['etag'],
+                    'last_modified': validators['last_modified'] or known['last_modified'],
+                    'content_length': known['content_length'],
+                    'sha256': known['sha256'],
+                    'edition_date': known['edition_date'],
+                }
+            
+            if status == 200:
+                # Success!
+                self.pdf_store.adopt(filepath, validators['sha256'])
+                tried.append((pattern, True))
+                return {
+                    'url': url,
+                    'pattern': pattern,
+                    'tried': tried,
+                    'size': size,
+                    'status': 'downloaded',
+                    'changed': True,
+                    'etag': validators['etag'],
+                    'last_modified': validators['last_modified'],
+                    'content_length': validators['content_length'],
+                    'sha256': validators['sha256'],
+                    # La fecha de edición de un PDF nuevo la completa pdf_extract, fuera de estos hilos
+                    'edition_date': known['edition_date'] if known and known['sha256'] == validators['sha256'] else None,
+                }
+            
+            if status != 404:
+                # 403, 429 o 5xx tras los reintentos: no prueba que el formulario no exista, y
+                # probar los demás patrones solo cargaría más al servidor; queda para la próxima ejecución
+                errors = True
+                break
+            tried.append((pattern, False))
         
-        print(f"✗ {form_number:15} - Not found")
-        return None, 0, 'not_found'
+        return {'url': None, 'size': 0, 'status': 'not_found', 'changed': False, 'tried': tried,
+                'errors': errors, 'etag': None, 'last_modified': None, 'content_length': None,
+                'sha256': None, 'edition_date': None}
     
-    def save_to_db(self, form_number, url, size, status):
-        conn = sqlite3.connect(self.db_path)
-        c = conn.cursor()
-        c.execute('''INSERT OR REPLACE INTO forms 
-            (form_number, pdf_url, pdf_filename, file_size, download_date, status)
-            VALUES (?, ?, ?, ?, ?, ?)''',
-            (form_number, url, f"{form_number}.pdf", size, datetime.now().isoformat(), status))
-        conn.commit()
-        conn.close()
+    def save_to_db(self, form_number, result):
+        self.store.save_form(
+            form_number=form_number,
+            pdf_url=result['url'],
+            pdf_filename=f"{form_number}.pdf",
+            file_size=result['size'],
+            download_date=datetime.now().isoformat(),
+            status=result['status'],
+            etag=result['etag'],
+            last_modified=result['last_modified'],
+            content_length=result['content_length'],
+            sha256=result['sha256'],
+            edition_date=result['edition_date'],
+        )
+        if result['sha256']:
+            if result['changed']:
+                self.store.save_object(result['sha256'], result['size'])
+            # Edición nueva, o la misma vista otra vez (actualiza last_seen)
+            self.store.save_edition(form_number, result['sha256'], result['size'], result['edition_date'])
     
-    def run(self):
+    def run(self, forms=None):
+        """Descargar 'forms' (por defecto COMMON_FORMS)"""
+        forms = forms or COMMON_FORMS
         print("=" * 70)
         print("USCIS Forms Quick Downloader")
         print("=" * 70)
         
         self.init_db()
+        # Un evento por petición: download_events.jsonl y la tabla download_events
+        self.metrics = DownloadMetrics('quick_download', os.path.join(self.output_dir, LOG_NAME))
         
         downloaded = 0
+        unchanged = 0
+        skipped = 0
         failed = 0
+        errors = 0
+        total = len(forms)
         
-        for i, form in enumerate(COMMON_FORMS, 1):
-            print(f"[{i}/{len(COMMON_FORMS)}] ", end="")
-            url, size, status = self.try_download(form)
-            self.save_to_db(form, url, size, status)
+        # Las descargas corren en paralelo; solo este hilo escribe en la BD
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = {pool.submit(self.try_download, form): form for form in forms}
             
-            if status == 'downloaded':
-                downloaded += 1
-            else:
-                failed += 1
-            
-            time.sleep(0.3)  # Be nice to server
+            for i, future in enumerate(as_completed(futures), 1):
+                form = futures[future]
+                result = future.result()
+                self.resolver.record(form, result)
+                
+                if result.get('skipped'):
+                    # Se conserva la fila existente; no hubo petición
+                    skipped += 1
+                    print(f"[{i}/{total}] - {form:15} - no encontrado antes (en caché)")
+                    continue
+                
+                if result['status'] != 'downloaded' and result.get('errors'):
+                    # Error de red o del servidor: se conserva la fila y se reintenta en la próxima ejecución
+                    errors += 1
+                    print(f"[{i}/{total}] ✗ {form:15} - error (se reintentará)")
+                    continue
+                
+                self.save_to_db(form, result)
+                
+                if result['status'] == 'downloaded' and not result['changed']:
+                    unchanged += 1
+                    print(f"[{i}/{total}] = {form:15} - sin cambios")
+                elif result['status'] == 'downloaded':
+                    downloaded += 1
+                    print(f"[{i}/{total}] ✓ {form:15} - {result['size']:10,} bytes - {result['url']}")
+                else:
+                    failed += 1
+                    print(f"[{i}/{total}] ✗ {form:15} - Not found")
+        
+        self.store.flush()
+        self.resolver.save(self.store.conn)
+        if self.extract:
+            pdf_extract.update(self.store.conn, self.pdfs_dir)
+        # Cobertura frente a la lista oficial (conjuntos en memoria, sin red)
+        coverage = catalog_diff.coverage(self.store.conn, self.pdfs_dir)
+        catalog_diff.write_json(coverage, os.path.join(self.output_dir, 'coverage.json'))
+        metrics = self.metrics.summary(self.store.conn)
+        self.metrics.save(self.store.conn)
+        self.metrics.close()
+        self.store.close()
         
         print("\n" + "=" * 70)
         print(f"Descargados: {downloaded}")
+        print(f"Sin cambios: {unchanged}")
         print(f"No encontrados: {failed}")
-        print(f"Total: {len(COMMON_FORMS)}")
+        print(f"Errores (se reintentarán): {errors}")
+        print(f"Omitidos (no encontrados en caché): {skipped}")
+        print(f"Total: {total}")
+        print(catalog_diff.summary_line(coverage))
+        print(format_summary(metrics))
         print(f"\nBase de datos: {self.db_path}")
         print(f"PDFs: {self.pdfs_dir}")
         print("=" * 70)
 
 if __name__ == '__main__':
-    downloader = QuickDownloader()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='USCIS Forms Quick Downloader')
+    parser.add_argument('--workers', type=int, default=8, help='descargas en paralelo')
+    parser.add_argument('--rate', type=float, default=10.0, help='peticiones por segundo por host (0 = sin límite)')
+    parser.add_argument('--full', action='store_true', help='descargar todo de nuevo (sin GET condicional)')
+    parser.add_argument('--negative-ttl', type=float, default=7,
+                        help='días antes de volver a probar un formulario no encontrado')
+    parser.add_argument('--no-extract', action='store_true', help='no extraer metadatos ni texto de los PDF')
+    args = parser.parse_args()
+    
+    downloader = QuickDownloader(workers=args.workers, max_per_second=args.rate,
+                                 incremental=not args.full, negative_ttl_days=args.negative_ttl,
+                                 extract=not args.no_extract)
     downloader.run()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Servidor local que reproduce uscis.gov para pruebas de rendimiento
+Sirve la copia guardada de "Todos los formularios" y los PDF de
+uscis_forms/pdfs en las mismas rutas que el sitio real, con latencia, errores
+503 y formularios inexistentes (404) configurables. replay_session() devuelve
+una Session de http_client que envía aquí las peticiones a uscis.gov.
+"""
+
+import hashlib
+import os
+import random
+import re
+import sys
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import form_discovery
+from http_client import TracingAdapter, create_session
+
+SNAPSHOT_PATH = 'uscis_forms/page_source.html'
+PDFS_PATH = 'uscis_forms/pdfs'
+
+# Orígenes reales que se redirigen al servidor local
+ORIGINS = ('https://www.uscis.gov', 'https://egov.uscis.gov')
+
+PDF_ROUTE = re.compile(r'^/sites/default/files/document/forms/([a-z0-9-]+)\.pdf$')
+PAGE_ROUTE = '/es/formularios/todos-los-formularios'
+
+
+class ReplayStats:
+    """Contadores del servidor (peticiones, bytes y códigos de estado)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.bytes_sent = 0
+            self.status = {}
+
+    def record(self, status, size):
+        with self.lock:
+            self.requests += 1
+            self.bytes_sent += size
+            self.status[status] = self.status.get(status, 0) + 1
+
+    def snapshot(self):
+        with self.lock:
+            return {'requests': self.requests, 'bytes_sent': self.bytes_sent, 'status': dict(self.status)}
+
+
+class ReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, como el sitio real
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.delay()
+        path = self.path.split('?', 1)[0]
+
+        if server.should_fail():
+            return self.send_body(503, b'Servicio no disponible', 'text/plain')
+        if path == PAGE_ROUTE:
+            return self.send_body(200, server.page, 'text/html; charset=utf-8')
+        match = PDF_ROUTE.match(path)
+        if match and match.group(1) in server.pdfs and not server.is_missing(match.group(1)):
+            return self.send_pdf(server.pdfs[match.group(1)])
+        self.send_body(404, b'No encontrado', 'text/plain')
+
+    def send_body(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.stats.record(status, len(body))
+
+    def send_pdf(self, pdf):
+        data, etag, last_modified = pdf
+        headers = {'ETag': etag, 'Last-Modified': last_modified, 'Accept-Ranges': 'bytes'}
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            self.server.stats.record(304, 0)
+            return
+
+        # Range: bytes=N- (reanudación de download_file); If-Range debe coincidir
+        range_header = self.headers.get('Range', '')
+        match = re.match(r'bytes=(\d+)-$', range_header)
+        if match and self.headers.get('If-Range', etag) == etag:
+            start = int(match.group(1))
+            if start >= len(data):
+                return self.send_body(416, b'', 'application/pdf',
+                                      {'Content-Range': f'bytes */{len(data)}'})
+            headers['Content-Range'] = f'bytes {start}-{len(data) - 1}/{len(data)}'
+            return self.send_body(206, data[start:], 'application/pdf', headers)
+        self.send_body(200, data, 'application/pdf', headers)
+
+
+class ReplayServer(ThreadingHTTPServer):
+    """
+    latency: segundos por petición (+ jitter aleatorio de hasta 'jitter')
+    error_rate: fracción de peticiones que responden 503
+    missing_rate: fracción de formularios que responden 404 (siempre los mismos para una semilla)
+    """
+    daemon_threads = True
+    request_queue_size = 64  # con el valor por defecto (5) los hilos esperan al reintento de SYN
+
+    def __init__(self, address=('127.0.0.1', 0), snapshot=SNAPSHOT_PATH, pdfs_dir=PDFS_PATH,
+                 latency=0.0, jitter=0.0, error_rate=0.0, missing_rate=0.0, seed=0):
+        super().__init__(address, ReplayHandler)
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.missing_rate = missing_rate
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.random_lock = threading.Lock()
+        self.stats = ReplayStats()
+        self.thread = None
+
+        with open(snapshot, 'rb') as f:
+            self.page = f.read()
+        # Los PDF se cargan una vez: el servidor no debe ser el cuello de botella
+        self.pdfs = {}
+        for filename in os.listdir(pdfs_dir):
+            if filename.lower().endswith('.pdf'):
+                path = os.path.join(pdfs_dir, filename)
+                with open(path, 'rb') as f:
+                    data = f.read()
+                etag = '"' + hashlib.sha256(data).hexdigest()[:32] + '"'
+                last_modified = formatdate(os.path.getmtime(path), usegmt=True)
+                self.pdfs[filename[:-4].lower()] = (data, etag, last_modified)
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def delay(self):
+        if self.latency or self.jitter:
+            with self.random_lock:
+                extra = self.random.uniform(0, self.jitter)
+            time.sleep(self.latency + extra)
+
+    def should_fail(self):
+        if not self.error_rate:
+            return False
+        with self.random_lock:
+            return self.random.random() < self.error_rate
+
+    def is_missing(self, name):
+        # Determinista: el mismo formulario falta en todas las ejecuciones
+        digest = hashlib.sha256(f'{self.seed}:{name}'.encode()).digest()
+        return int.from_bytes(digest[:4], 'big') / 2 ** 32 < self.missing_rate
+
+    def handle_error(self, request, client_address):
+        # Clientes que cierran la conexión keep-alive al terminar: no es un error
+        if not isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            super().handle_error(request, client_address)
+
+    def start(self):
+        """Atender en un hilo de fondo; devuelve la URL base"""
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class ReplayAdapter(TracingAdapter):
+    """Adaptador (con trazas) que envía las peticiones de ORIGINS al servidor local"""
+
+    def __init__(self, base_url, **kwargs):
+        self.base_url = base_url
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        for origin in ORIGINS:
+            if request.url.startswith(origin):
+                request.url = self.base_url + request.url[len(origin):]
+                break
+        return super().send(request, **kwargs)
+
+
+def replay_session(base_url, pool_size=16, **kwargs):
+    """Session de create_session() (mismos reintentos y timeouts) dirigida al servidor local"""
+    session = create_session(pool_size=pool_size, **kwargs)
+    retries = session.get_adapter('https://').max_retries
+    adapter = ReplayAdapter(base_url, pool_connections=4, pool_maxsize=pool_size, max_retries=retries)
+    for origin in ORIGINS:
+        session.mount(origin, adapter)
+    return session
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Servidor local que reproduce uscis.gov')
+    parser.add_argument('--port', type=int, default=8800)
+    parser.add_argument('--latency', type=float, default=0.0, help='ms por petición')
+    parser.add_argument('--jitter', type=float, default=0.0, help='ms aleatorios adicionales (máximo)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fracción de respuestas 503')
+    parser.add_argument('--missing-rate', type=float, default=0.0, help='fracción de formularios con 404')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    server = ReplayServer(('127.0.0.1', args.port), latency=args.latency / 1000, jitter=args.jitter / 1000,
+                          error_rate=args.error_rate, missing_rate=args.missing_rate, seed=args.seed)
+    print(f"Reproduciendo uscis.gov en {server.base_url}")
+    print(f"  Página de formularios: {server.base_url}{PAGE_ROUTE}")
+    print(f"  PDF: {len(server.pdfs)} ({server.base_url}{form_discovery.PDF_URL.split('uscis.gov', 1)[1]})")
+    print("Presiona Ctrl+C para detener")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
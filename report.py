@@ -1,8 +1,8 @@
 #!/usr/bin/env python3
-import sqlite3
-import os
+import forms_db
+import forms_stats
 
-db_path = 'uscis_forms/uscis_forms.db'
+db_path = forms_db.DB_PATH
 pdfs_dir = 'uscis_forms/pdfs'
 
 print("=" * 70)
@@ -10,20 +10,13 @@ print("REPORTE DE DESCARGA - FORMULARIOS USCIS")
 print("=" * 70)
 
 # Database stats
-conn = sqlite3.connect(db_path)
+conn = forms_db.open_db(db_path)
 cursor = conn.cursor()
 
-cursor.execute('SELECT COUNT(*) FROM forms')
-total_forms = cursor.fetchone()[0]
-
-cursor.execute('SELECT status, COUNT(*) FROM forms GROUP BY status')
-status_counts = cursor.fetchall()
-
-cursor.execute('SELECT SUM(file_size) FROM forms WHERE status="downloaded"')
-total_size = cursor.fetchone()[0] or 0
-
-cursor.execute('SELECT form_number, form_title, file_size FROM forms WHERE status="downloaded" ORDER BY file_size DESC LIMIT 10')
-top_forms = cursor.fetchall()
+stats = forms_stats.read(conn)
+total_forms = stats['total']
+total_size = stats['downloaded_bytes']
+top_forms = forms_db.largest_forms(conn, 10)
 
 cursor.execute('SELECT * FROM scrape_log ORDER BY id DESC LIMIT 1')
 last_scrape = cursor.fetchone()
@@ -32,7 +25,7 @@ print(f"\n📊 ESTADÍSTICAS GENERALES")
 print("-" * 70)
 print(f"Total formularios en base de datos: {total_forms}")
 print(f"\nEstados de formularios:")
-for status, count in status_counts:
+for status, count in stats['status'].items():
     print(f"  • {status}: {count}")
 
 print(f"\n💾 ALMACENAMIENTO")
@@ -40,7 +33,7 @@ print("-" * 70)
 print(f"Tamaño total descargado: {total_size:,} bytes ({total_size/(1024*1024):.2f} MB)")
 
 # Count actual PDF files
-pdf_count = len([f for f in os.listdir(pdfs_dir) if f.endswith('.pdf')])
+pdf_count = forms_stats.count_pdfs(pdfs_dir)
 print(f"Archivos PDF físicos: {pdf_count}")
 
 print(f"\n📋 TOP 10 ARCHIVOS MÁS GRANDES")
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Índice de búsqueda FTS5 para los formularios USCIS
+Indexa número, título, palabras clave (español/inglés) y el texto de cada PDF
+"""
+
+import re
+from datetime import datetime
+
+import forms_db
+
+PDFS_PATH = 'uscis_forms/pdfs'
+
+# Nombres con los que la gente busca los formularios más comunes
+KEYWORDS = {
+    'I-9': 'verificación de elegibilidad de empleo employment eligibility verification',
+    'I-90': 'renovar reemplazar green card tarjeta de residente mica',
+    'I-130': 'petición familiar pariente extranjero family petition',
+    'I-131': 'permiso de viaje documento de viaje advance parole travel document',
+    'I-140': 'petición trabajador inmigrante employment based',
+    'I-485': 'ajuste de estatus residencia permanente green card adjustment',
+    'I-539': 'extensión cambio de estatus no inmigrante extend change status',
+    'I-589': 'asilo refugio asylum withholding of removal',
+    'I-601': 'perdón exención inadmisibilidad waiver',
+    'I-601A': 'perdón provisional presencia ilegal provisional waiver',
+    'I-693': 'examen médico vacunas medical exam',
+    'I-751': 'remover condiciones residencia condicional remove conditions',
+    'I-765': 'permiso de trabajo autorización de empleo work permit ead',
+    'I-821': 'estatus de protección temporal tps',
+    'I-821D': 'daca acción diferida dreamers deferred action',
+    'I-864': 'declaración jurada de patrocinio affidavit of support',
+    'I-912': 'exención de tarifas fee waiver',
+    'I-918': 'visa u víctima de crimen',
+    'AR-11': 'cambio de dirección domicilio change of address',
+    'G-28': 'abogado representante attorney',
+    'G-639': 'foia libertad de información expediente',
+    'G-1145': 'notificación electrónica aviso e-notification',
+    'N-400': 'ciudadanía naturalización citizenship',
+    'N-565': 'reemplazo certificado naturalización replacement certificate',
+    'N-600': 'certificado de ciudadanía hijos citizenship certificate',
+    'N-648': 'excepción discapacidad examen médico disability exception',
+}
+
+
+def index_form(conn, number, title, body, mtime, size):
+    """Reemplazar la fila de un formulario en forms_fts (en la transacción del llamador)"""
+    conn.execute('DELETE FROM forms_fts WHERE form_number = ?', (number,))
+    conn.execute('INSERT INTO forms_fts (form_number, title, keywords, body) VALUES (?, ?, ?, ?)',
+                 (number, title or '', KEYWORDS.get(number, ''), body))
+    conn.execute('INSERT OR REPLACE INTO search_index_state VALUES (?, ?, ?, ?)',
+                 (number, mtime, size, datetime.now().isoformat()))
+
+
+def remove_stale(conn):
+    """Quitar del índice los formularios que ya no están descargados; devuelve cuántos"""
+    removed = [number for (number,) in conn.execute('''
+        SELECT form_number FROM search_index_state
+        WHERE form_number NOT IN (SELECT form_number FROM forms WHERE status='downloaded')
+    ''')]
+    with conn:
+        for number in removed:
+            conn.execute('DELETE FROM forms_fts WHERE form_number = ?', (number,))
+            conn.execute('DELETE FROM search_index_state WHERE form_number = ?', (number,))
+    return len(removed)
+
+
+def build_match_query(query):
+    """
+    Convertir el texto del usuario en una consulta FTS5 segura.
+    Cada palabra se busca por prefijo; 'I-765' se busca como la frase "i 765".
+    """
+    terms = []
+    for word in query.split():
+        parts = re.findall(r'\w+', word.lower())
+        if parts:
+            terms.append('"' + ' '.join(parts) + '"*')
+    return ' '.join(terms)
+
+
+def is_built(conn):
+    return conn.execute('SELECT 1 FROM search_index_state LIMIT 1').fetchone() is not None
+
+
+def search(conn, query, limit=50):
+    """(form_number, form_title, pdf_filename, file_size) ordenados por relevancia"""
+    match = build_match_query(query)
+    if not match:
+        return []
+    # bm25: pesa más coincidir en el número y el título que en el cuerpo del PDF
+    return conn.execute('''
+        SELECT f.form_number, COALESCE(f.form_title, NULLIF(forms_fts.title, '')),
+               f.pdf_filename, f.file_size
+        FROM forms_fts
+        JOIN forms f ON f.form_number = forms_fts.form_number
+        WHERE forms_fts MATCH ? AND f.status='downloaded'
+        ORDER BY bm25(forms_fts, 10.0, 5.0, 5.0, 1.0)
+        LIMIT ?
+    ''', (match, limit)).fetchall()
+
+
+if __name__ == '__main__':
+    import argparse
+    import pdf_extract
+
+    parser = argparse.ArgumentParser(description='Índice de búsqueda de formularios USCIS')
+    parser.add_argument('--force', action='store_true', help='volver a extraer el texto de todos los PDF')
+    parser.add_argument('--workers', type=int, default=None, help='procesos (por defecto, uno por núcleo)')
+    args = parser.parse_args()
+
+    if pdf_extract.PdfReader is None:
+        print("⚠ pypdf no está instalado: solo se indexarán números, títulos y palabras clave")
+
+    # El texto se extrae junto con los metadatos (pdf_extract.py)
+    conn = forms_db.open_db(forms_db.DB_PATH)
+    indexed, removed = pdf_extract.update(conn, PDFS_PATH, force=args.force, workers=args.workers)
+    total = conn.execute('SELECT COUNT(*) FROM search_index_state').fetchone()[0]
+    conn.close()
+
+    print(f"Indexados: {indexed}")
+    print(f"Eliminados: {removed}")
+    print(f"Total en el índice: {total}")
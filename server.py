@@ -2,14 +2,242 @@
 """
 Servidor web simple para la base de datos de formularios USCIS
 """
-from flask import Flask, jsonify, send_file, render_template
-import sqlite3
+from flask import Flask, jsonify, request, send_file, render_template, stream_with_context
+import gzip
+import hashlib
 import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+try:
+    import brotli
+except ImportError:  # brotli es opcional; sin él se usa solo gzip
+    brotli = None
+
+import form_fields
+import forms_db
+import forms_stats
+import search_index
+import server_metrics
 
 app = Flask(__name__, static_folder='.', static_url_path='')
 
-DB_PATH = 'uscis_forms/uscis_forms.db'
+DB_PATH = forms_db.DB_PATH
 PDFS_PATH = 'uscis_forms/pdfs'
+POOL_SIZE = int(os.environ.get('USCIS_DB_POOL_SIZE', 8))
+# Los workers solo leen: con mode=ro no compiten por el bloqueo de escritura
+DB_READONLY = os.environ.get('USCIS_DB_READONLY', '0') == '1'
+
+# El catálogo puede cambiar en cualquier momento: el navegador revalida con ETag
+JSON_CACHE_CONTROL = 'no-cache'
+# Los PDF cambian solo con una nueva edición (y entonces cambia el ETag)
+PDF_MAX_AGE = 24 * 3600
+MIN_COMPRESS_SIZE = 1024
+
+# Paginación de /api/forms
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+FORM_FIELDS = ('number', 'title', 'filename', 'size')
+
+# Entrega de PDF: '' (Python, con sendfile si el servidor WSGI lo ofrece),
+# 'x-sendfile' (Apache/lighttpd) o 'x-accel' (nginx, ver USCIS_ACCEL_PREFIX)
+SENDFILE_MODE = os.environ.get('USCIS_SENDFILE_MODE', '').lower()
+ACCEL_PREFIX = os.environ.get('USCIS_ACCEL_PREFIX', '/protected-pdfs/')
+app.config['USE_X_SENDFILE'] = SENDFILE_MODE == 'x-sendfile'
+
+
+class CachedPayload:
+    """Cuerpo JSON con su ETag y sus versiones comprimidas (se calculan una vez)"""
+
+    def __init__(self, body):
+        self.body = body.encode('utf-8')
+        self.etag = hashlib.sha256(self.body).hexdigest()[:32]
+        self.encoded = {}
+        self.lock = threading.Lock()
+
+    def encode(self, encoding):
+        with self.lock:
+            if encoding not in self.encoded:
+                if encoding == 'br':
+                    self.encoded[encoding] = brotli.compress(self.body)
+                else:
+                    self.encoded[encoding] = gzip.compress(self.body, compresslevel=6)
+            return self.encoded[encoding]
+
+
+class ResponseCache:
+    """Respuestas JSON ya serializadas, válidas mientras no cambie la versión del catálogo"""
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.version = None
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version, key):
+        with self.lock:
+            if version != self.version:
+                # Un descargador escribió en la BD: todo lo cacheado es viejo
+                self.entries.clear()
+                self.version = version
+                self.misses += 1
+                return None
+            payload = self.entries.get(key)
+            if payload is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+            return payload
+
+    def put(self, version, key, payload):
+        with self.lock:
+            if version != self.version:
+                return
+            self.entries[key] = payload
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+cache = ResponseCache()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Pool de conexiones del proceso (se crea en la primera petición)"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = forms_db.ConnectionPool(DB_PATH, size=POOL_SIZE, readonly=DB_READONLY)
+        return _pool
+
+
+def close_pool():
+    """Cerrar las conexiones del proceso (al apagar el servidor o un worker)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+            _pool = None
+
+
+@contextmanager
+def db_connection():
+    """Conexión del pool; la espera y el tiempo de uso van a las métricas de la petición"""
+    start = time.perf_counter()
+    with get_pool().connection() as conn:
+        acquired = time.perf_counter()
+        try:
+            yield conn
+        finally:
+            server_metrics.record_db(acquired - start, time.perf_counter() - acquired)
+
+
+def _cache_metrics():
+    with cache.lock:
+        return [(('hit',), cache.hits), (('miss',), cache.misses)]
+
+
+server_metrics.registry.add(server_metrics.CallbackMetric(
+    'uscis_response_cache_total', 'Consultas a la caché de respuestas JSON', 'counter', _cache_metrics, ('result',)))
+server_metrics.registry.add(server_metrics.CallbackMetric(
+    'uscis_response_cache_entries', 'Respuestas en la caché', 'gauge', lambda: [((), len(cache.entries))]))
+server_metrics.install(app)
+
+
+def form_to_dict(row, fields=FORM_FIELDS):
+    form = {
+        'number': row[0],
+        'title': row[1] or f'Formulario {row[0]}',
+        'filename': row[2],
+        'size': row[3]
+    }
+    if fields is not FORM_FIELDS:
+        form = {field: form[field] for field in fields}
+    return form
+
+
+def parse_fields(value):
+    """fields=number,title -> ('number', 'title'); None si hay un campo desconocido"""
+    if not value:
+        return FORM_FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(',') if f.strip()))
+    if not fields or any(f not in FORM_FIELDS for f in fields):
+        return None
+    return fields
+
+
+def parse_limit(value):
+    """limit=N -> N; None si no se pasa. ValueError si no es un entero positivo (en SQLite un LIMIT negativo no limita)"""
+    if not value:
+        return None
+    limit = int(value)
+    if limit < 1:
+        raise ValueError(f'limit={value}')
+    return limit
+
+
+def json_response(payload):
+    """Respuesta JSON con ETag, 304 si el cliente ya la tiene y compresión negociada"""
+    encodings = ['br', 'gzip'] if brotli else ['gzip']
+    encoding = None
+    if len(payload.body) >= MIN_COMPRESS_SIZE:
+        encoding = request.accept_encodings.best_match(encodings)
+    # ETag distinto por codificación (como hace Apache con -gzip)
+    etag = f'{payload.etag}-{encoding}' if encoding else payload.etag
+    
+    if request.if_none_match.contains_weak(etag) or request.if_none_match.contains_weak(payload.etag):
+        response = app.response_class(status=304)
+    else:
+        body = payload.encode(encoding) if encoding else payload.body
+        response = app.response_class(body, mimetype='application/json')
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = JSON_CACHE_CONTROL
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def downloadable_filenames():
+    """{nombre: sha256} de los PDF descargados según la BD (cacheado por versión del catálogo)"""
+    with db_connection() as conn:
+        version = forms_db.catalog_version(conn)
+        names = cache.get(version, 'filenames')
+        if names is None:
+            names = forms_db.downloaded_filenames(conn)
+            cache.put(version, 'filenames', names)
+    return names
+
+
+_pdf_etags = {}
+_pdf_etags_lock = threading.Lock()
+
+
+def pdf_etag(filepath):
+    """SHA-256 del PDF, recalculado solo si cambió su tamaño o fecha"""
+    stat = os.stat(filepath)
+    key = (stat.st_mtime_ns, stat.st_size)
+    with _pdf_etags_lock:
+        cached = _pdf_etags.get(filepath)
+    if cached and cached[0] == key:
+        return cached[1]
+    
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    etag = digest.hexdigest()
+    with _pdf_etags_lock:
+        _pdf_etags[filepath] = (key, etag)
+    return etag
 
 @app.route('/')
 def index():
@@ -17,87 +245,278 @@ def index():
 
 @app.route('/api/forms')
 def get_forms():
-    """Obtener todos los formularios descargados"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    # Obtener formularios
-    c.execute("""
-        SELECT form_number, form_title, pdf_filename, file_size 
-        FROM forms 
-        WHERE status='downloaded' 
-        ORDER BY form_number
-    """)
-    
-    forms = []
-    for row in c.fetchall():
-        forms.append({
-            'number': row[0],
-            'title': row[1] or f'Formulario {row[0]}',
-            'filename': row[2],
-            'size': row[3]
-        })
-    
-    # Estadísticas
-    total = len(forms)
-    total_size = sum(f['size'] for f in forms if f['size'])
-    series = len(set(f['number'].split('-')[0] for f in forms))
-    
-    conn.close()
-    
-    return jsonify({
-        'forms': forms,
-        'stats': {
-            'total': total,
-            'size': f'{total_size/(1024*1024):.2f} MB',
-            'series': series
-        }
-    })
+    """
+    Formularios descargados, por páginas ordenadas por número.
+    
+    ?limit=N       tamaño de página (máx. MAX_PAGE_SIZE)
+    ?after=I-130   continuar después de este número (valor de 'next')
+    ?series=I      solo una serie
+    ?fields=a,b    solo esos campos (number, title, filename, size)
+    ?format=ndjson un formulario por línea, transmitido sin armar la lista
+    """
+    fields = parse_fields(request.args.get('fields'))
+    if fields is None:
+        return jsonify({'error': f'Campos válidos: {", ".join(FORM_FIELDS)}'}), 400
+    try:
+        limit = parse_limit(request.args.get('limit'))
+    except ValueError:
+        return jsonify({'error': 'limit debe ser un entero positivo'}), 400
+    after = request.args.get('after') or None
+    series = request.args.get('series') or None
+    
+    if request.args.get('format') == 'ndjson':
+        return stream_forms(fields, after, series, limit)
+    
+    limit = min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    key = ('forms', after, series, limit, fields)
+    
+    with db_connection() as conn:
+        version = forms_db.catalog_version(conn)
+        payload = cache.get(version, key)
+        if payload is not None:
+            return json_response(payload)
+        
+        # Se pide una fila de más para saber si hay otra página
+        rows = forms_db.iter_downloaded_forms(conn, after, series, limit + 1).fetchall()
+    
+    next_after = rows[limit - 1][0] if len(rows) > limit else None
+    payload = CachedPayload(app.json.dumps({
+        'forms': [form_to_dict(row, fields) for row in rows[:limit]],
+        'next': next_after,
+    }))
+    cache.put(version, key, payload)
+    return json_response(payload)
+
+
+def stream_forms(fields, after, series, limit):
+    """NDJSON: las filas se leen del cursor y se envían una a una"""
+    def generate():
+        # Se consume después de after_request: su tiempo no entra en las métricas
+        with get_pool().connection() as conn:
+            for row in forms_db.iter_downloaded_forms(conn, after, series, limit):
+                yield app.json.dumps(form_to_dict(row, fields)) + '\n'
+    
+    return app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
+@app.route('/api/stats')
+def get_stats():
+    """Estadísticas del catálogo (lectura de forms_stats, cacheada)"""
+    with db_connection() as conn:
+        version = forms_db.catalog_version(conn)
+        payload = cache.get(version, 'stats')
+        if payload is not None:
+            return json_response(payload)
+        stats = forms_stats.read(conn)
+    
+    payload = CachedPayload(app.json.dumps({
+        'total': stats['downloaded'],
+        'size': f"{stats['downloaded_bytes']/(1024*1024):.2f} MB",
+        'series': len(stats['series']),
+        'by_series': stats['series'],
+    }))
+    cache.put(version, 'stats', payload)
+    return json_response(payload)
 
 @app.route('/download/<filename>')
 def download_form(filename):
-    """Descargar un formulario PDF"""
-    filepath = os.path.join(PDFS_PATH, filename)
+    """Descargar un formulario PDF (admite Range/206 para reanudar)"""
+    # Solo se entregan archivos registrados como descargados en la BD
+    filenames = downloadable_filenames()
+    if filename not in filenames:
+        return jsonify({'error': 'Archivo no encontrado'}), 404
     
-    if os.path.exists(filepath):
-        return send_file(filepath, as_attachment=True)
-    else:
+    filepath = os.path.join(PDFS_PATH, filename)
+    if not os.path.exists(filepath):
         return jsonify({'error': 'Archivo no encontrado'}), 404
+    
+    if SENDFILE_MODE == 'x-accel':
+        # nginx envía el archivo (sendfile, Range, ETag); el worker queda libre
+        response = app.response_class(mimetype='application/pdf')
+        response.headers['X-Accel-Redirect'] = ACCEL_PREFIX + filename
+        response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+    
+    # send_file responde 304 a If-None-Match con este ETag, 206 a Range,
+    # y usa wsgi.file_wrapper (sendfile) cuando el servidor lo ofrece
+    # El hash del almacén de contenido ya es un ETag; sin él se calcula aquí
+    etag = filenames[filename] or pdf_etag(filepath)
+    return send_file(filepath, as_attachment=True, etag=etag,
+                     max_age=PDF_MAX_AGE, conditional=True)
 
 @app.route('/api/search/<query>')
 def search_forms(query):
     """Buscar formularios"""
-    conn = sqlite3.connect(DB_PATH)
-    c = conn.cursor()
-    
-    c.execute("""
-        SELECT form_number, form_title, pdf_filename, file_size 
-        FROM forms 
-        WHERE status='downloaded' 
-        AND (form_number LIKE ? OR form_title LIKE ?)
-        ORDER BY form_number
-    """, (f'%{query}%', f'%{query}%'))
-    
-    forms = []
-    for row in c.fetchall():
-        forms.append({
-            'number': row[0],
-            'title': row[1] or f'Formulario {row[0]}',
-            'filename': row[2],
-            'size': row[3]
-        })
-    
-    conn.close()
-    return jsonify({'forms': forms})
+    key = ('search', query.strip().lower())
+    
+    with db_connection() as conn:
+        version = forms_db.catalog_version(conn)
+        payload = cache.get(version, key)
+        if payload is not None:
+            return json_response(payload)
+        
+        # Índice FTS5 si ya se construyó (python search_index.py); si no, LIKE
+        if search_index.is_built(conn):
+            rows = search_index.search(conn, query)
+        else:
+            rows = forms_db.downloaded_forms(conn, query)
+    
+    payload = CachedPayload(app.json.dumps({'forms': [form_to_dict(row) for row in rows]}))
+    cache.put(version, key, payload)
+    return json_response(payload)
+
+@app.route('/api/changes')
+def get_changes():
+    """
+    Ediciones nuevas desde una fecha.
+
+    ?since=2025-01-01       fecha u hora ISO (por defecto, últimos 7 días)
+    ?limit=N                máximo de ediciones (por defecto MAX_PAGE_SIZE)
+    """
+    since = request.args.get('since') or (date.today() - timedelta(days=7)).isoformat()
+    try:
+        # first_seen es texto ISO: se compara con la fecha normalizada, no con lo recibido
+        since = forms_db.iso_timestamp(since)
+    except ValueError:
+        return jsonify({'error': 'since debe ser una fecha ISO (AAAA-MM-DD)'}), 400
+    try:
+        limit = min(parse_limit(request.args.get('limit')) or MAX_PAGE_SIZE, MAX_PAGE_SIZE)
+    except ValueError:
+        return jsonify({'error': 'limit debe ser un entero positivo'}), 400
+    key = ('changes', since, limit)
+
+    with db_connection() as conn:
+        version = forms_db.catalog_version(conn)
+        payload = cache.get(version, key)
+        if payload is not None:
+            return json_response(payload)
+        rows = forms_db.changes_since(conn, since, limit)
+
+    payload = CachedPayload(app.json.dumps({
+        'since': since,
+        'changes': [{
+            'number': number,
+            'edition': edition,
+            'sha256': sha256,
+            'size': size,
+            'first_seen': first_seen,
+            'previous_edition': previous,
+            'new_form': previous_sha is None,
+        } for number, edition, sha256, size, first_seen, previous, previous_sha in rows],
+    }))
+    cache.put(version, key, payload)
+    return json_response(payload)
+
+@app.route('/api/forms/<form_number>/editions')
+def get_editions(form_number):
+    """Historial de ediciones de un formulario, la más reciente primero"""
+    key = ('editions', form_number)
+
+    with db_connection() as conn:
+        version = forms_db.catalog_version(conn)
+        payload = cache.get(version, key)
+        if payload is not None:
+            return json_response(payload)
+        rows = forms_db.edition_history(conn, form_number)
+
+    if not rows:
+        return jsonify({'error': 'Formulario sin historial'}), 404
+    payload = CachedPayload(app.json.dumps({
+        'number': form_number,
+        'editions': [{
+            'edition': edition,
+            'sha256': sha256,
+            'size': size,
+            'first_seen': first_seen,
+            'last_seen': last_seen,
+        } for sha256, edition, size, first_seen, last_seen in rows],
+    }))
+    cache.put(version, key, payload)
+    return json_response(payload)
+
+@app.route('/api/forms/<form_number>/fields')
+@app.route('/api/forms/<form_number>/fields/<path:name>')
+def get_form_fields(form_number, name=None):
+    """Campos rellenables de un formulario; con nombre, solo ese campo (corto o completo)"""
+    key = ('fields', form_number, name)
+
+    with db_connection() as conn:
+        version = forms_db.catalog_version(conn)
+        payload = cache.get(version, key)
+        if payload is not None:
+            return json_response(payload)
+        rows = forms_db.form_field_schema(conn, form_number, name)
+
+    if not rows:
+        return jsonify({'error': 'Campo no encontrado' if name else 'Formulario sin campos indexados'}), 404
+    payload = CachedPayload(app.json.dumps({
+        'number': form_number,
+        'fields': [form_fields.row_to_dict(row) for row in rows],
+    }))
+    cache.put(version, key, payload)
+    return json_response(payload)
+
+@app.route('/api/fields/<short_name>')
+def find_fields(short_name):
+    """Formularios que tienen un campo con este nombre corto (p. ej. Pt1Line1a_FamilyName)"""
+    key = ('find_fields', short_name)
+
+    with db_connection() as conn:
+        version = forms_db.catalog_version(conn)
+        payload = cache.get(version, key)
+        if payload is not None:
+            return json_response(payload)
+        rows = forms_db.find_fields(conn, short_name)
+
+    payload = CachedPayload(app.json.dumps({'fields': [form_fields.row_to_dict(row) for row in rows]}))
+    cache.put(version, key, payload)
+    return json_response(payload)
+
+def serve_production(host, port, threads):
+    """Servidor WSGI multihilo (waitress); Ctrl+C o SIGTERM lo detienen limpiamente"""
+    import signal
+    from waitress import create_server
+    
+    # Migraciones una sola vez, antes de atender peticiones
+    forms_db.open_db(DB_PATH).close()
+    
+    wsgi_server = create_server(app, host=host, port=port, threads=threads)
+    
+    # SIGTERM se trata igual que Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        wsgi_server.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Dejar de aceptar conexiones y esperar a que terminen las peticiones en curso
+        wsgi_server.close()
+        wsgi_server.task_dispatcher.shutdown(timeout=30)
+        close_pool()
+        print("\nServidor detenido")
 
 if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Servidor de Formularios USCIS')
+    parser.add_argument('--production', action='store_true',
+                        help='servidor WSGI multihilo (waitress) en lugar del servidor de desarrollo')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('USCIS_THREADS', 8)),
+                        help='hilos de trabajo en modo producción')
+    args = parser.parse_args()
+    
     print("=" * 70)
     print("Servidor de Formularios USCIS")
     print("=" * 70)
     print(f"\nBase de datos: {DB_PATH}")
     print(f"PDFs: {PDFS_PATH}")
-    print("\nNavega a: http://localhost:5000")
+    print(f"\nNavega a: http://localhost:{args.port}")
     print("\nPresiona Ctrl+C para detener el servidor")
     print("=" * 70)
     
-    app.run(debug=True, port=5000)
+    if args.production:
+        serve_production(args.host, args.port, args.threads)
+    else:
+        app.run(debug=True, host=args.host, port=args.port)
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Métricas de server.py en el formato de texto de Prometheus
+Contadores e histogramas en memoria del proceso (sin dependencias): cada
+petición cuesta un par de perf_counter y un lock por métrica. install()
+agrega los hooks de Flask y la ruta /metrics.
+"""
+
+import bisect
+import os
+import threading
+import time
+
+from flask import g, request
+
+# Segundos: de 1 ms a 5 s
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Bytes: de 256 B a 4 MB (los PDF más grandes rondan 2.5 MB)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, value=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + value
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        with self.lock:
+            values = list(self.values.items())
+        for labels, value in sorted(values):
+            yield f'{self.name}{_labels(self.label_names, labels)} {_number(value)}'
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = labels
+        self.buckets = tuple(buckets)
+        self.values = {}  # etiquetas -> [cuenta por bucket..., +Inf, suma]
+        self.lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(labels)
+            if entry is None:
+                entry = self.values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[index] += 1
+            entry[-1] += value
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        with self.lock:
+            values = [(labels, list(entry)) for labels, entry in self.values.items()]
+        for labels, entry in sorted(values):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), entry):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                yield f'{self.name}_bucket{_labels(self.label_names, labels, le)} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.label_names, labels)} {_number(entry[-1])}'
+            yield f'{self.name}_count{_labels(self.label_names, labels)} {cumulative}'
+
+
+class CallbackMetric:
+    """Valor leído al exportar (p. ej. contadores que ya lleva otro objeto)"""
+
+    def __init__(self, name, help, kind, callback, labels=()):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.label_names = labels
+        self.callback = callback
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} {self.kind}'
+        for labels, value in self.callback():
+            yield f'{self.name}{_labels(self.label_names, labels)} {_number(value)}'
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+REQUESTS = registry.add(Counter(
+    'uscis_http_requests_total', 'Peticiones atendidas', ('route', 'method', 'status')))
+LATENCY = registry.add(Histogram(
+    'uscis_http_request_duration_seconds', 'Tiempo hasta tener la respuesta lista', ('route',)))
+RESPONSE_SIZE = registry.add(Histogram(
+    'uscis_http_response_size_bytes', 'Tamaño del cuerpo enviado', ('route',), SIZE_BUCKETS))
+DB_WAIT = registry.add(Histogram(
+    'uscis_db_pool_wait_seconds', 'Espera de una conexión libre del pool de SQLite', ('route',)))
+DB_TIME = registry.add(Histogram(
+    'uscis_db_query_duration_seconds', 'Tiempo de consultas SQLite por petición', ('route',)))
+PDF_BYTES = registry.add(Counter(
+    'uscis_pdf_bytes_served_total', 'Bytes de PDF entregados por Python (200 y 206)'))
+
+
+def _route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'other'
+
+
+def record_db(wait, elapsed):
+    """Sumar a la petición actual la espera del pool y el tiempo de consultas"""
+    g.metrics_db_wait = g.get('metrics_db_wait', 0.0) + wait
+    g.metrics_db_time = g.get('metrics_db_time', 0.0) + elapsed
+
+
+def _before_request():
+    g.metrics_start = time.perf_counter()
+
+
+def _after_request(response):
+    start = g.get('metrics_start')
+    if start is None:
+        return response
+    route = _route()
+    LATENCY.observe(time.perf_counter() - start, route)
+    REQUESTS.inc(route, request.method, str(response.status_code))
+    size = response.content_length
+    if size is not None:
+        RESPONSE_SIZE.observe(size, route)
+        if request.endpoint == 'download_form' and response.status_code in (200, 206):
+            PDF_BYTES.inc(value=size)
+    if 'metrics_db_time' in g:
+        DB_WAIT.observe(g.metrics_db_wait, route)
+        DB_TIME.observe(g.metrics_db_time, route)
+    return response
+
+
+def install(app, path='/metrics'):
+    """Registrar los hooks de medición y la ruta de exportación (USCIS_METRICS=0 los desactiva)"""
+    if os.environ.get('USCIS_METRICS', '1') == '0':
+        return
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+
+    @app.route(path)
+    def metrics():
+        return app.response_class(registry.render(), content_type=CONTENT_TYPE)
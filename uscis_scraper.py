@@ -6,20 +6,20 @@ Uses USCIS API endpoint to get forms data
 """
 
 import os
-import sqlite3
-import requests
 import json
 import time
 from datetime import datetime
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-import re
+
+import catalog_diff
+from download_metrics import LOG_NAME, DownloadMetrics, format_summary
+import form_discovery
+from forms_db import FormsStore, load_sync_state
+from http_client import IncompleteDownload, conditional_headers, create_session, download_file
+import pdf_extract
+from pdf_store import PdfStore
 
 class USCISFormsScraper:
-    def __init__(self, output_dir='uscis_forms'):
+    def __init__(self, output_dir='uscis_forms', session=None, delay=0.5):
         self.base_url = 'https://www.uscis.gov'
         # Try multiple possible API endpoints
         self.api_endpoints = [
@@ -29,6 +29,7 @@ class USCISFormsScraper:
         ]
         self.output_dir = output_dir
         self.pdfs_dir = os.path.join(output_dir, 'pdfs')
+        self.pdf_store = PdfStore(os.path.join(output_dir, 'store'))
         self.db_path = os.path.join(output_dir, 'uscis_forms.db')
         
         os.makedirs(self.pdfs_dir, exist_ok=True)
@@ -39,41 +40,17 @@ class USCISFormsScraper:
             'Accept-Language': 'es-ES,es;q=0.9,en;q=0.8',
         }
         
-    def init_database(self):
-        """Initialize SQLite database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS forms (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                form_number TEXT UNIQUE,
-                form_title TEXT,
-                form_description TEXT,
-                edition_date TEXT,
-                pdf_url TEXT,
-                pdf_filename TEXT,
-                instructions_url TEXT,
-                download_date TEXT,
-                file_size INTEGER,
-                category TEXT,
-                status TEXT DEFAULT 'pending'
-            )
-        ''')
+        # Session compartida: reutiliza conexiones TLS entre API y PDFs
+        self.session = session or create_session(headers=self.headers)
+        # Pausa de cortesía entre descargas (segundos)
+        self.delay = delay
+        # Eventos en memoria para llamadas sueltas a download_pdf; run() los escribe en el log y la BD
+        self.metrics = DownloadMetrics('uscis_scraper')
         
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS scrape_log (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                scrape_date TEXT,
-                total_forms INTEGER,
-                downloaded INTEGER,
-                failed INTEGER,
-                status TEXT
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+    def init_database(self):
+        """Initialize SQLite database (schema and migrations live in forms_db)"""
+        # Una sola conexión para toda la ejecución (WAL, escrituras por lotes)
+        self.store = FormsStore(self.db_path)
         print(f"✓ Base de datos inicializada: {self.db_path}")
     
     def try_api_endpoints(self):
@@ -81,7 +58,7 @@ class USCISFormsScraper:
         for endpoint in self.api_endpoints:
             print(f"\nProbando API: {endpoint}")
             try:
-                response = requests.get(endpoint, headers=self.headers, timeout=15)
+                response = self.session.get(endpoint, timeout=15)
                 if response.status_code == 200:
                     try:
                         data = response.json()
@@ -94,9 +71,24 @@ class USCISFormsScraper:
         
         return None
     
+    def scrape_html(self, snapshot=None):
+        """Parse the forms page HTML with lxml (no browser); [] if it has no form list"""
+        source = snapshot or form_discovery.FORMS_PAGE_URL
+        print(f"\nLeyendo formularios del HTML: {source}")
+        try:
+            return form_discovery.discover(self.session, snapshot)
+        except Exception as e:
+            print(f"  ✗ No se pudo leer el HTML: {e}")
+            return []
+    
     def scrape_with_selenium_wait(self):
-        """Use Selenium with extended waits for dynamic content"""
-        print("\nUsando Selenium con espera extendida...")
+        """Render the page in Chrome (only when the plain HTML has no form list)"""
+        print("\nUsando Selenium (el HTML no trae la lista de formularios)...")
+        # Selenium solo se necesita para este respaldo
+        from selenium import webdriver
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support.ui import WebDriverWait
+        from selenium.webdriver.chrome.options import Options
         
         chrome_options = Options()
         # Don't use headless - sometimes pages don't render properly headless
@@ -105,65 +97,27 @@ class USCISFormsScraper:
         chrome_options.add_argument('user-agent=Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36')
         
         driver = None
-        forms = []
         
         try:
             driver = webdriver.Chrome(options=chrome_options)
-            driver.get('https://www.uscis.gov/es/formularios/todos-los-formularios')
+            driver.get(form_discovery.FORMS_PAGE_URL)
             
             print("Esperando que carguen los formularios...")
-            time.sleep(10)  # Wait longer for JavaScript
-            
-            # Scroll to load lazy content
-            for _ in range(5):
-                driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
-                time.sleep(2)
+            # Esperar a que aparezcan los enlaces (no un tiempo fijo)
+            WebDriverWait(driver, 30).until(
+                lambda d: len(d.find_elements(By.CSS_SELECTOR, 'a[href*="/es/i-"]')) >= form_discovery.MIN_FORMS)
+            driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
             
-            # Try to find any form elements
             page_text = driver.page_source
             
-            # Save for debugging
+            # Se puede volver a usar sin navegador: --snapshot debug_page.html
             with open(os.path.join(self.output_dir, 'debug_page.html'), 'w', encoding='utf-8') as f:
                 f.write(page_text)
             
-            # Look for form numbers in text
-            form_pattern = re.compile(r'([A-Z]-\d+[A-Z]?)', re.IGNORECASE)
-            matches = set(form_pattern.findall(page_text))
-            
-            print(f"Encontrados {len(matches)} números de formulario en el HTML")
-            
-            # Try to find links to forms
-            elements = driver.find_elements(By.TAG_NAME, 'a')
-            
-            for elem in elements:
-                try:
-                    href = elem.get_attribute('href') or ''
-                    text = elem.text.strip()
-                    
-                    # Check if this is likely a form
-                    form_num_match = form_pattern.search(text)
-                    
-                    if form_num_match:
-                        form_number = form_num_match.group(1).upper()
-                        
-                        form_data = {
-                            'form_number': form_number,
-                            'title': text,
-                            'url': href
-                        }
-                        
-                        if '.pdf' in href.lower():
-                            form_data['pdf_url'] = href
-                        
-                        forms.append(form_data)
-                
-                except Exception as e:
-                    continue
-            
-            # Remove duplicates
-            unique_forms = {f['form_number']: f for f in forms}.values()
-            
-            return list(unique_forms)
+            # Un solo análisis del HTML en lugar de una llamada a WebDriver por enlace
+            forms = form_discovery.parse_forms_html(page_text, form_discovery.FORMS_PAGE_URL)
+            print(f"Encontrados {len(forms)} formularios en el HTML")
+            return forms
             
         except Exception as e:
             print(f"✗ Error con Selenium: {e}")
@@ -228,91 +182,117 @@ class USCISFormsScraper:
         print(f"✓ Cargados {len(forms)} formularios comunes")
         return forms
     
-    def download_pdf(self, pdf_url, form_number):
-        """Download PDF file"""
+    def download_pdf(self, pdf_url, form_number, known=None):
+        """Download PDF file (conditional GET if we already have it)"""
         try:
             filename = f"{form_number}.pdf"
             filepath = os.path.join(self.pdfs_dir, filename)
             
+            headers = {}
             if os.path.exists(filepath):
-                print(f"  ↷ Ya existe: {filename}")
-                return filepath, os.path.getsize(filepath)
+                known = known or {}
+                headers = conditional_headers(known.get('etag'), known.get('last_modified'), filepath)
             
-            response = requests.get(pdf_url, headers=self.headers, timeout=60, stream=True)
-            response.raise_for_status()
+            with self.metrics.request(form_number, pdf_url) as event:
+                status, file_size, validators = download_file(
+                    self.session, pdf_url, filepath, headers=headers, timeout=60)
+                event['status'], event['bytes'] = status, file_size
             
-            with open(filepath, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    f.write(chunk)
+            if status == 304:
+                validators['etag'] = validators['etag'] or known.get('etag')
+                validators['last_modified'] = validators['last_modified'] or known.get('last_modified')
+                validators['content_length'] = known.get('content_length')
+                validators['sha256'] = known.get('sha256')
+                if known.get('edition_date'):
+                    validators['edition_date'] = known['edition_date']
+                print(f"  ↷ Sin cambios: {filename}")
+                return filepath, os.path.getsize(filepath), validators
             
-            file_size = os.path.getsize(filepath)
+            if status == 404:
+                print(f"  ⚠ No encontrado (404): {pdf_url}")
+                return None, 0, {}
+            if status != 200:
+                print(f"  ✗ Error HTTP {status}")
+                return None, 0, {}
+            
+            self.pdf_store.adopt(filepath, validators['sha256'])
+            known = known or {}
+            if known.get('edition_date') and known.get('sha256') == validators['sha256']:
+                # Mismo contenido: pdf_extract no lo vuelve a leer, se conserva la fecha conocida
+                validators['edition_date'] = known['edition_date']
+            # Sin fecha de la página web, la del pie de un PDF nuevo la completa pdf_extract
             print(f"  ✓ Descargado: {filename} ({file_size:,} bytes)")
-            return filepath, file_size
+            return filepath, file_size, validators
             
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 404:
-                print(f"  ⚠ No encontrado (404): {pdf_url}")
-            else:
-                print(f"  ✗ Error HTTP {e.response.status_code}")
-            return None, 0
+        except IncompleteDownload as e:
+            print(f"  ✗ Descarga incompleta (se reanudará): {e}")
+            return None, 0, {}
         except Exception as e:
             print(f"  ✗ Error descargando: {e}")
-            return None, 0
+            return None, 0, {}
     
     def save_to_database(self, form_data):
         """Save form data to database"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('''
-                INSERT OR REPLACE INTO forms 
-                (form_number, form_title, form_description, pdf_url, pdf_filename, 
-                 download_date, file_size, edition_date, category, status, instructions_url)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                form_data.get('form_number'),
-                form_data.get('title', ''),
-                form_data.get('description', ''),
-                form_data.get('pdf_url', ''),
-                form_data.get('pdf_filename', ''),
-                datetime.now().isoformat(),
-                form_data.get('file_size', 0),
-                form_data.get('edition_date', ''),
-                form_data.get('category', form_data.get('source', '')),
-                form_data.get('status', 'downloaded'),
-                form_data.get('instructions_url', '')
-            ))
-            conn.commit()
-        except Exception as e:
-            print(f"  ✗ Error guardando en BD: {e}")
-        finally:
-            conn.close()
+        self.store.save_form(
+            form_number=form_data.get('form_number'),
+            form_title=form_data.get('title', ''),
+            form_description=form_data.get('description', ''),
+            pdf_url=form_data.get('pdf_url', ''),
+            pdf_filename=form_data.get('pdf_filename', ''),
+            download_date=datetime.now().isoformat(),
+            file_size=form_data.get('file_size', 0),
+            edition_date=form_data.get('edition_date') or None,
+            category=form_data.get('category', form_data.get('source', '')),
+            status=form_data.get('status', 'downloaded'),
+            instructions_url=form_data.get('instructions_url', ''),
+            etag=form_data.get('etag'),
+            last_modified=form_data.get('last_modified'),
+            content_length=form_data.get('content_length'),
+            sha256=form_data.get('sha256'),
+        )
+        if form_data.get('sha256'):
+            self.store.save_object(form_data['sha256'], form_data.get('file_size', 0))
+            self.store.save_edition(form_data['form_number'], form_data['sha256'],
+                                    form_data.get('file_size', 0), form_data.get('edition_date') or None)
     
-    def run(self):
-        """Main execution"""
+    def run(self, snapshot=None, browser='auto', extract=True):
+        """
+        Main execution.
+        snapshot: HTML guardado de la página de formularios (sin red ni navegador)
+        browser: 'auto' (solo si el HTML no trae la lista), 'always' o 'never'
+        extract: extraer metadatos, campos y texto de los PDF al terminar
+        """
         print("=" * 70)
         print("USCIS Forms Scraper v3")
         print("=" * 70)
         
         self.init_database()
+        self.metrics = DownloadMetrics('uscis_scraper', os.path.join(self.output_dir, LOG_NAME))
+        
+        sync_state = load_sync_state(self.store.conn)
         
         # Strategy 1: Try API
         api_data = self.try_api_endpoints()
         
         forms = []
         
-        # Strategy 2: Try Selenium with extended wait
-        if not api_data:
+        # Strategy 2: Parse the forms page HTML (lxml, sin navegador)
+        if not api_data and browser != 'always':
+            forms = self.scrape_html(snapshot)
+        
+        # Strategy 3: Render the page with Selenium
+        if not api_data and not forms and browser != 'never':
             forms = self.scrape_with_selenium_wait()
         
-        # Strategy 3: Use manual list of common forms
+        # Strategy 4: Use manual list of common forms
         if not forms:
             print("\n⚠ No se pudieron obtener formularios automáticamente")
             forms = self.get_common_forms_manually()
         
         if not forms:
             print("\n✗ No se pudo obtener ningún formulario")
+            self.metrics.close()
+            self.store.close()
             return
         
         print(f"\nIniciando descarga de {len(forms)} formularios...")
@@ -325,12 +305,23 @@ class USCISFormsScraper:
             form_number = form.get('form_number', f'FORM_{i}')
             print(f"\n[{i}/{len(forms)}] {form_number}: {form.get('title', 'Sin título')[:50]}")
             
-            if 'pdf_url' in form:
-                filepath, file_size = self.download_pdf(form['pdf_url'], form_number)
+            if form.get('pdf_url'):
+                known = sync_state.get(form_number)
+                filepath, file_size, validators = self.download_pdf(form['pdf_url'], form_number, known)
+                
+                if not filepath and known and known['status'] == 'downloaded' and \
+                        os.path.exists(os.path.join(self.pdfs_dir, f"{form_number}.pdf")):
+                    # Falló la revisión de un PDF que ya tenemos: se conserva la fila y se reintenta la próxima vez
+                    failed += 1
+                    print(f"  ↷ Se conserva la copia descargada")
+                    if self.delay:
+                        time.sleep(self.delay)
+                    continue
                 
                 if filepath:
                     form['pdf_filename'] = os.path.basename(filepath)
                     form['file_size'] = file_size
+                    form.update(validators)
                     form['status'] = 'downloaded'
                     downloaded += 1
                 else:
@@ -338,22 +329,26 @@ class USCISFormsScraper:
                     failed += 1
                 
                 self.save_to_database(form)
-                time.sleep(0.5)
+                if self.delay:
+                    time.sleep(self.delay)
             else:
                 print(f"  ⚠ No se encontró URL de PDF")
                 form['status'] = 'no_pdf'
                 failed += 1
                 self.save_to_database(form)
         
-        # Log results
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO scrape_log (scrape_date, total_forms, downloaded, failed, status)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (datetime.now().isoformat(), len(forms), downloaded, failed, 'completed'))
-        conn.commit()
-        conn.close()
+        # Log results (hace flush de las filas pendientes)
+        self.store.log_scrape(len(forms), downloaded, failed, 'completed')
+        if extract:
+            pdf_extract.update(self.store.conn, self.pdfs_dir)
+        # Cobertura: lista oficial, lo publicado en USCIS, la BD y los PDF
+        discovered = [f['form_number'] for f in forms if f.get('source') == 'html'] or None
+        coverage = catalog_diff.coverage(self.store.conn, self.pdfs_dir, discovered)
+        catalog_diff.write_json(coverage, os.path.join(self.output_dir, 'coverage.json'))
+        metrics = self.metrics.summary(self.store.conn)
+        self.metrics.save(self.store.conn)
+        self.metrics.close()
+        self.store.close()
         
         # Summary
         print("\n" + "=" * 70)
@@ -362,11 +357,23 @@ class USCISFormsScraper:
         print(f"Total formularios procesados: {len(forms)}")
         print(f"Descargados exitosamente: {downloaded}")
         print(f"Fallidos: {failed}")
+        print(catalog_diff.summary_line(coverage))
+        print(format_summary(metrics))
         print(f"\nArchivos guardados en: {self.output_dir}")
         print(f"PDFs en: {self.pdfs_dir}")
         print(f"Base de datos: {self.db_path}")
         print("=" * 70)
 
 if __name__ == '__main__':
-    scraper = USCISFormsScraper()
-    scraper.run()
+    import argparse
+    
+    parser = argparse.ArgumentParser(description='Descargar formularios USCIS')
+    parser.add_argument('--snapshot', help='HTML guardado de la página de formularios (p. ej. uscis_forms/page_source.html)')
+    parser.add_argument('--browser', choices=['auto', 'always', 'never'], default='auto',
+                        help='usar Chrome/Selenium: solo si el HTML no trae la lista (auto), siempre o nunca')
+    parser.add_argument('--delay', type=float, default=0.5, help='segundos de pausa entre descargas')
+    parser.add_argument('--no-extract', action='store_true', help='no extraer metadatos ni texto de los PDF')
+    args = parser.parse_args()
+    
+    scraper = USCISFormsScraper(delay=args.delay)
+    scraper.run(snapshot=args.snapshot, browser=args.browser, extract=not args.no_extract)
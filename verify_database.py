@@ -2,10 +2,13 @@
 """
 Verificacion completa de la base de datos USCIS
 """
-import sqlite3
 import os
 
-db_path = 'uscis_forms/uscis_forms.db'
+import consistency
+import forms_db
+import forms_stats
+
+db_path = forms_db.DB_PATH
 pdfs_dir = 'uscis_forms/pdfs'
 
 print("=" * 80)
@@ -13,41 +16,38 @@ print("VERIFICACION COMPLETA DE BASE DE DATOS")
 print("=" * 80)
 
 # Conectar a BD
-conn = sqlite3.connect(db_path)
+conn = forms_db.open_db(db_path)
 c = conn.cursor()
 
 # Estadísticas generales
 print("\n1. ESTADISTICAS GENERALES")
 print("-" * 80)
 
-c.execute("SELECT COUNT(*) FROM forms")
-total_registros = c.fetchone()[0]
-print(f"Total registros en BD: {total_registros}")
+stats = forms_stats.read(conn)
+print(f"Total registros en BD: {stats['total']}")
 
-c.execute("SELECT status, COUNT(*) FROM forms GROUP BY status")
-for status, count in c.fetchall():
+for status, count in stats['status'].items():
     print(f"  - {status}: {count}")
 
 # Tamaño total
-c.execute("SELECT SUM(file_size) FROM forms WHERE status='downloaded'")
-total_size = c.fetchone()[0] or 0
+total_size = stats['downloaded_bytes']
 print(f"\nTamaño total descargado: {total_size:,} bytes ({total_size/(1024*1024):.2f} MB)")
 
 # Archivos físicos
-pdf_files = [f for f in os.listdir(pdfs_dir) if f.endswith('.pdf')]
-print(f"Archivos PDF físicos: {len(pdf_files)}")
+check = consistency.check(conn, pdfs_dir)
+print(f"Archivos PDF físicos: {check['files']}")
 
 # Verificar consistencia
 print("\n2. VERIFICACION DE CONSISTENCIA")
 print("-" * 80)
 
-c.execute("SELECT COUNT(*) FROM forms WHERE status='downloaded' AND pdf_filename IS NOT NULL")
-registros_con_pdf = c.fetchone()[0]
-
-if len(pdf_files) == registros_con_pdf:
-    print(f"OK - Archivos PDF ({len(pdf_files)}) coinciden con registros ({registros_con_pdf})")
+if not check['issues']:
+    print(f"OK - Archivos PDF ({check['files']}) coinciden con registros ({check['records']})")
 else:
-    print(f"ADVERTENCIA - PDFs: {len(pdf_files)}, Registros: {registros_con_pdf}")
+    print(f"ADVERTENCIA - PDFs: {check['files']}, Registros: {check['records']}")
+    for issue in check['issues']:
+        print(f"  {issue['form'] or '-':12} {issue['file']:20} {consistency.ISSUE_LABELS[issue['kind']]}")
+    print("  (python consistency.py --repair para volver a descargarlos)")
 
 # Mostrar muestra de datos
 print("\n3. MUESTRA DE FORMULARIOS EN BASE DE DATOS (primeros 20)")
@@ -67,11 +67,7 @@ for num, title, size, status in c.fetchall():
 print("\n4. FORMULARIOS POR SERIE")
 print("-" * 80)
 
-series = {}
-c.execute("SELECT form_number FROM forms WHERE status='downloaded'")
-for (num,) in c.fetchall():
-    prefix = num.split('-')[0] if '-' in num else 'Otros'
-    series[prefix] = series.get(prefix, 0) + 1
+series = stats['series']
 
 for prefix in sorted(series.keys()):
     print(f"Serie {prefix:10}: {series[prefix]:3} formularios")
@@ -79,13 +75,7 @@ for prefix in sorted(series.keys()):
 # Top 10 más grandes
 print("\n5. TOP 10 ARCHIVOS MAS GRANDES")
 print("-" * 80)
-c.execute("""SELECT form_number, CAST(file_size AS INTEGER) as size 
-             FROM forms 
-             WHERE status='downloaded' 
-             ORDER BY size DESC 
-             LIMIT 10""")
-
-for i, (num, size) in enumerate(c.fetchall(), 1):
+for i, (num, _, size) in enumerate(forms_db.largest_forms(conn, 10), 1):
     print(f"{i:2}. {num:12} - {size/1024:8.1f} KB ({size/(1024*1024):.2f} MB)")
 
 # Ejemplos de consultas útiles